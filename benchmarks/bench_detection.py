@@ -0,0 +1,180 @@
+"""Messages/sec and accuracy of the old three-function path, the single-pass engine and entity-first detection.
+
+Each synthetic message carries the entities Telegram would have parsed for it
+(none for plain chatter, so the entity path falls back to the engine) and the
+violation it should be reported as. Spam includes cases only entities can
+see (text_link, text_mention, bare domains), regex false positives (emails,
+"/cmd@some_bot" commands) and links or mentions in code/pre spans, which
+Telegram leaves unparsed. Run from the repository root:
+
+    python benchmarks/bench_detection.py [--seconds 2]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+
+# --- Legacy path (verbatim copy of the pre-engine helpers) ---
+def legacy_has_links(text):
+    if not text:
+        return False
+    pattern = r"(https?://|t\.me/|wa\.me|instagram\.com|youtube\.com|facebook\.com|twitter.com|whatsapp\.com|linkedin\.com|snapchat\.com|pinterest\.com|reddit\.com|tiktok\.com|discord\.gg|telegram\.me)"
+    return bool(re.search(pattern, text, re.IGNORECASE))
+
+
+def legacy_has_bot_username(text):
+    if not text:
+        return False
+    pattern = r"@[\w_]*bot"
+    return bool(re.search(pattern, text, re.IGNORECASE))
+
+
+def legacy_has_username(text):
+    if not text:
+        return False
+    pattern = r"@[\w_]+"
+    return bool(re.search(pattern, text, re.IGNORECASE))
+
+
+def legacy_classify(text):
+    # Same order and short-circuiting as the old filter_messages
+    if legacy_has_links(text):
+        return "links"
+    if legacy_has_bot_username(text):
+        return "botlink"
+    if legacy_has_username(text):
+        return "username"
+    return None
+
+
+def first_violation(found):
+    for violation_type in bot.VIOLATION_ORDER:
+        if violation_type in found:
+            return violation_type
+    return None
+
+
+def engine_classify(text):
+    return first_violation(bot.scan_text(text))
+
+
+def entity_classify(text, entities):
+    # Same choice bot.scan_message makes
+    if entities:
+        return first_violation(bot.scan_entities(text, entities))
+    return first_violation(bot.scan_text(text))
+
+
+# --- Corpus ---
+WORDS = ("hello", "everyone", "what", "is", "up", "today", "the", "match", "was",
+         "great", "anyone", "watching", "tonight", "lol", "ok", "nice", "thanks",
+         "bro", "see", "you", "later", "meeting", "at", "five", "pm")
+BOT_USER = bot.types.User(id=42, is_bot=True, first_name="Promo")
+HUMAN_USER = bot.types.User(id=43, is_bot=False, first_name="Alice")
+# (fragment, entity Telegram parses for it, offset of the entity in the
+# fragment, extra entity fields, expected violation)
+SPAM = (
+    ("https://spam.example/x", "url", 0, {}, "links"),
+    ("t.me/joinchat", "url", 0, {}, "links"),
+    ("@free_crypto_bot", "mention", 0, {}, "botlink"),
+    ("@someone", "mention", 0, {}, "username"),
+    ("instagram.com/promo", "url", 0, {}, "links"),
+    ("mail me at a@b.co", "email", 11, {}, None),
+    ("@wa.me", "url", 1, {}, "links"),
+    ("discord.gg/abc", "url", 0, {}, "links"),
+    ("cheapdeals.shop/now", "url", 0, {}, "links"),
+    ("click here", "text_link", 0, {"url": "https://spam.example/y"}, "links"),
+    ("Promo", "text_mention", 0, {"user": BOT_USER}, "botlink"),
+    ("Alice", "text_mention", 0, {"user": HUMAN_USER}, "username"),
+    ("/start@jobs_bot", "bot_command", 0, {}, None),
+    ("t.me/spamchannel", "code", 0, {}, "links"),
+    ("@promo_bot", "code", 0, {}, "botlink"),
+    ("join wa.me/123 now", "pre", 0, {}, "links"),
+)
+
+
+def build_corpus(size, long_ratio, spam_ratio, seed=1):
+    """Return [(text, entities or None, expected violation)]."""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        length = rng.randint(150, 600) if rng.random() < long_ratio else rng.randint(3, 15)
+        words = [rng.choice(WORDS) for _ in range(length)]
+        entities, expected = None, None
+        if rng.random() < spam_ratio:
+            fragment, kind, offset, fields, expected = rng.choice(SPAM)
+            at = rng.randrange(len(words) + 1)
+            prefix = " ".join(words[:at] + [""]) if at else ""
+            entities = [bot.types.MessageEntity(type=kind, offset=len(prefix) + offset,
+                                                length=len(fragment) - offset, **fields)]
+            words.insert(at, fragment)
+        corpus.append((" ".join(words), entities, expected))
+    return corpus
+
+
+def measure(func, corpus, seconds):
+    done = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for text, entities, _ in corpus:
+            func(text, entities)
+        done += len(corpus)
+    return done / (time.perf_counter() - start)
+
+
+def accuracy(corpus):
+    # Per expected label: messages, and how many each path classified correctly
+    rows = {}
+    for text, entities, expected in corpus:
+        kind = entities[0].type if entities else "plain"
+        row = rows.setdefault((kind, expected), [0, 0, 0, 0])
+        row[0] += 1
+        row[1] += legacy_classify(text) == expected
+        row[2] += engine_classify(text) == expected
+        row[3] += entity_classify(text, entities) == expected
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0, help="time per measurement")
+    parser.add_argument("--size", type=int, default=2000, help="messages per corpus")
+    args = parser.parse_args()
+
+    corpora = {
+        "short clean": build_corpus(args.size, 0.0, 0.0),
+        "short mixed": build_corpus(args.size, 0.0, 0.3),
+        "long clean": build_corpus(args.size // 10, 1.0, 0.0),
+        "long mixed": build_corpus(args.size // 10, 1.0, 0.3),
+    }
+
+    print(f"{'corpus':<12} {'legacy msg/s':>14} {'engine msg/s':>14} {'entity msg/s':>14} {'vs legacy':>10}")
+    for name, corpus in corpora.items():
+        mismatches = sum(legacy_classify(t) != engine_classify(t) for t, _, _ in corpus)
+        if mismatches:
+            print(f"{name}: {mismatches} engine/legacy classification mismatches!")
+        legacy = measure(lambda text, entities: legacy_classify(text), corpus, args.seconds)
+        engine = measure(lambda text, entities: engine_classify(text), corpus, args.seconds)
+        entity = measure(entity_classify, corpus, args.seconds)
+        print(f"{name:<12} {legacy:>14,.0f} {engine:>14,.0f} {entity:>14,.0f} {entity / legacy:>9.2f}x")
+
+    print()
+    print(f"{'entity':<14} {'expected':<10} {'messages':>9} {'legacy':>8} {'engine':>8} {'entity':>8}")
+    rows = accuracy(corpora["short mixed"] + corpora["long mixed"])
+    totals = [0, 0, 0, 0]
+    for (kind, expected), row in sorted(rows.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+        print(f"{kind:<14} {str(expected):<10} {row[0]:>9} " + " ".join(f"{hits / row[0]:>8.0%}" for hits in row[1:]))
+        totals = [total + value for total, value in zip(totals, row)]
+    print(f"{'all':<14} {'':<10} {totals[0]:>9} " + " ".join(f"{hits / totals[0]:>8.0%}" for hits in totals[1:]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Lookup cost and memory of per-group domain allow/block lists as they grow.
+
+Lists --domains (allowed or blocked) domains spread over --chats groups in
+the bot's DomainLists (one map of packed rules shared by every group, looked
+up once per parent domain of the host) and in a per-group list checked entry
+by entry, then times the verdict for link hosts seen in a group: subdomains
+of listed domains and unlisted hosts. Memory counts what each structure adds
+to the domain strings it is given.
+
+    python benchmarks/bench_domain_lists.py [--domains 1000 10000 50000] [--chats 2000]
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+TLDS = ("com", "org", "net", "io", "ru", "de", "co.uk", "com.br", "me", "xyz")
+
+
+def random_domain(rng):
+    name = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 12)))
+    return f"{name}.{rng.choice(TLDS)}"
+
+
+def build_entries(count, chats, seed=11):
+    # (chat_id, domain, allowed); a few popular domains are listed by many groups
+    rng = random.Random(seed)
+    chat_ids = [-1001000000000 - index for index in range(chats)]
+    popular = [random_domain(rng) for _ in range(50)]
+    entries = {}
+    while len(entries) < count:
+        domain = rng.choice(popular) if rng.random() < 0.2 else random_domain(rng)
+        entries[(rng.choice(chat_ids), domain)] = rng.random() < 0.5
+    return [(chat_id, domain, allowed) for (chat_id, domain), allowed in entries.items()]
+
+
+class NaiveLists:
+    # Per-group list, each entry checked as an exact match or parent domain
+    def __init__(self):
+        self.by_chat = {}
+
+    def set(self, chat_id, domain, allowed):
+        self.by_chat.setdefault(chat_id, []).append((domain, allowed))
+
+    def verdict(self, chat_id, host):
+        best, best_length = None, 0
+        for domain, allowed in self.by_chat.get(chat_id, ()):
+            if (host == domain or host.endswith("." + domain)) and len(domain) > best_length:
+                best, best_length = allowed, len(domain)
+        return best
+
+
+def build(factory, entries):
+    tracemalloc.start()
+    lists = factory()
+    for chat_id, domain, allowed in entries:
+        lists.set(chat_id, domain, allowed)
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return lists, used
+
+
+def lookup_ns(lists, probes):
+    start = time.perf_counter()
+    for chat_id, host in probes:
+        lists.verdict(chat_id, host)
+    return (time.perf_counter() - start) / len(probes) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--domains", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--chats", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'domains':>8} {'storage':<12} {'bytes/domain':>13} {'hit ns':>8} {'miss ns':>8}")
+    for count in args.domains:
+        entries = build_entries(count, args.chats)
+        rng = random.Random(5)
+        # Hosts are checked in the group that listed their parent domain
+        hits = [(chat_id, f"www.{domain}") for chat_id, domain, _ in rng.choices(entries, k=20000)]
+        misses = [(chat_id, random_domain(rng)) for chat_id, _, _ in rng.choices(entries, k=20000)]
+        for name, factory in (("shared", bot.DomainLists), ("per-group", NaiveLists)):
+            lists, used = build(factory, entries)
+            print(f"{count:>8} {name:<12} {used / count:>13.0f} {lookup_ns(lists, hits):>8.0f} "
+                  f"{lookup_ns(lists, misses):>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
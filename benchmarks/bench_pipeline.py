@@ -0,0 +1,167 @@
+"""Offline benchmark of the moderation pipeline (filter_messages -> warn_and_delete).
+
+Synthetic group message updates are fed through the bot's update pipeline
+(UPDATE_WORKERS workers, one update per chat at a time) to the real
+dispatcher `dp`, with the Bot's HTTP session replaced by the in-process
+FakeTelegram, which can simulate latency and flood errors. Each scenario runs
+in its own process so caches and counters start cold. Reports throughput,
+p50/p99 handler latency and inline Bot API calls per message (deferred
+deletions and log digests are counted as queued, not sent). The outbound
+scheduler's rate limits are lifted except for the raid and backlog
+scenarios, which depend on them.
+
+    python benchmarks/bench_pipeline.py [--messages 5000] [--latency-ms 20] [--flood-rate 0.01]
+    python benchmarks/bench_pipeline.py --scenario link_spam --real-limits
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+REAL_LIMIT_SCENARIOS = ("raid", "backlog")
+SCENARIOS = ("clean", "link_spam", "username_spam", "bio_links", "text_wave", "raid", "backlog")
+WAVE_TEXTS = ("Earn 5000 dollars a week from home with our trading group, message me now to join",
+              "Verified crypto signals with 98 percent accuracy, write to me in private for the invite")
+WORDS = ("hello", "everyone", "what", "is", "up", "today", "the", "match", "was", "great",
+         "anyone", "watching", "tonight", "lol", "ok", "nice", "thanks", "see", "you", "later")
+
+
+def build_updates(scenario, count, chats, users, seed=3):
+    rng = random.Random(seed)
+    spammers = set(rng.sample(range(100, 100 + users), max(1, users // 5)))
+    updates = []
+    for update_id in range(count):
+        if scenario in ("link_spam", "username_spam", "text_wave", "raid", "backlog") and rng.random() < 0.6:
+            user_id = rng.choice(sorted(spammers))
+        else:
+            user_id = rng.randrange(100, 100 + users)
+        words = [rng.choice(WORDS) for _ in range(rng.randint(3, 20))]
+        if user_id in spammers and scenario in ("link_spam", "raid", "backlog"):
+            words.insert(rng.randrange(len(words)), rng.choice(("https://spam.example/x", "t.me/joinus")))
+        elif user_id in spammers and scenario == "username_spam":
+            words.insert(rng.randrange(len(words)), rng.choice(("@crypto_signals", "@free_money_bot")))
+        if user_id in spammers and scenario == "text_wave":
+            # Link-free copies across groups, varied by case, digits and padding
+            words = rng.choice(WAVE_TEXTS).split()
+            words[rng.randrange(len(words))] = words[0].upper()
+            words.append(rng.choice(("!!", "🔥", str(rng.randrange(100)))))
+        # A raid floods a single group
+        chat_id = -1001000000000 - (0 if scenario == "raid" else rng.randrange(chats))
+        updates.append({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id + 1,
+                # The backlog scenario replays link spam buffered during an hour of downtime
+                "date": int(time.time()) - (3600 if scenario == "backlog" else 0),
+                "chat": {"id": chat_id, "type": "supergroup", "title": f"Group {chat_id}"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+                "text": " ".join(words),
+            },
+        })
+    bad_bios = spammers if scenario == "bio_links" else set()
+    return updates, (lambda uid: "dm me t.me/cheap_followers" if uid in bad_bios else "just a person")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_scenario(args):
+    import bot
+    import fake_bot
+
+    logging.getLogger("antilink").setLevel(logging.ERROR)
+    updates, bio_for = build_updates(args.scenario, args.messages, args.chats, args.users)
+    telegram = fake_bot.FakeTelegram(bio_for=bio_for, flood_rate=args.flood_rate)
+    fake_bot.install(bot, telegram, args.latency_ms / 1000, args.latency_ms / 4000)
+    if not args.real_limits and args.scenario not in REAL_LIMIT_SCENARIOS:
+        bot.outbound_scheduler.global_bucket = bot.TokenBucket(1e9)
+        bot.outbound_scheduler.chat_rate = bot.outbound_scheduler.chat_burst = 1e9
+
+    latencies = []
+
+    @bot.dp.update.outer_middleware()
+    async def timing(handler, update, data):
+        start = time.perf_counter()
+        try:
+            return await handler(update, data)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    bot.catch_up.quiet = 0.05  # backlog batches are classified after each short pause
+
+    workers = bot.update_pipeline.start()
+    start = time.perf_counter()
+    for data in updates:
+        await bot.update_pipeline.put(data)
+    await bot.update_pipeline.join()
+    await asyncio.gather(*bot.catch_up.tasks)
+    elapsed = time.perf_counter() - start
+    for task in (*workers, *bot.notice_tasks):
+        task.cancel()
+
+    calls = sum(telegram.calls.values())
+    return {
+        "scenario": args.scenario,
+        "messages": len(updates),
+        "throughput": len(updates) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "calls_per_message": calls / len(updates),
+        "calls": dict(telegram.calls),
+        "floods": telegram.floods,
+        "raids": bot.raid_guard.started,
+        "queued_notices": len(bot.notice_tasks),
+        "queued_deletions": len(bot.deletion_scheduler),
+        "queued_log_events": len(bot.log_sink),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=SCENARIOS, help="run one scenario in this process")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=20, help="simulated Bot API latency")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="share of API calls answered with 429")
+    parser.add_argument("--real-limits", action="store_true",
+                        help="keep the outbound scheduler's rate limits in every scenario")
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    if args.scenario:
+        print(json.dumps(asyncio.run(run_scenario(args))))
+        return
+
+    results = []
+    passthrough = [arg for arg in sys.argv[1:] if arg != "--json"]
+    for scenario in SCENARIOS:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--scenario", scenario, *passthrough],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'scenario':<14} {'msg/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'calls/msg':>10}  calls")
+    for r in results:
+        calls = ", ".join(f"{name}={count}" for name, count in sorted(r["calls"].items()))
+        print(f"{r['scenario']:<14} {r['throughput']:>9,.0f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+              f"{r['calls_per_message']:>10.3f}  {calls}")
+
+
+if __name__ == "__main__":
+    main()
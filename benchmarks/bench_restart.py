@@ -0,0 +1,112 @@
+"""Time-to-ready of bot.py after a graceful restart (SIGHUP, as sent by /restart).
+
+The stand-in server (fake_api_server.py) replays a steady stream of group
+messages while bot.py polls it, with outbound rate limits lifted so the
+queue holds only what the bot has not got to yet. After --warmup seconds the bot is sent
+SIGHUP: it stops intake, drains or snapshots its queue within
+SHUTDOWN_DRAIN_TIMEOUT, re-executes itself and restores the snapshot. The
+antilink_restart_ready_seconds gauge on /metrics (seconds from intake stopping
+to intake running again) is read once the new process answers. Each
+--drain value is run --runs times; 0 hands every queued update over in the
+snapshot instead of finishing it.
+
+    python benchmarks/bench_restart.py [--drain 20 0] [--runs 3] [--rate 300]
+"""
+import argparse
+import os
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+READY_RE = re.compile(r"^antilink_restart_ready_seconds (\S+)$", re.MULTILINE)
+CHECKED_RE = re.compile(r"^antilink_messages_checked_total (\S+)$", re.MULTILINE)
+
+
+def scrape(port, path="/metrics"):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as response:
+            return response.read().decode()
+    except OSError:
+        return None
+
+
+def wait_for(port, pattern, timeout):
+    # First value of `pattern` above zero, or None
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        metrics = scrape(port)
+        match = pattern.search(metrics) if metrics else None
+        if match and float(match.group(1)) > 0:
+            return float(match.group(1))
+        time.sleep(0.05)
+    return None
+
+
+def run(drain, args, tmp):
+    api_port, bot_port = args.port, args.port + 10
+    tmp = tempfile.mkdtemp(dir=tmp)  # a run must not pick up the previous run's snapshot
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "fake_api_server.py"), "--port", str(api_port),
+         "--scenario", "link_spam", "--count", str(int(args.rate * (args.warmup + 60))),
+         "--rate", str(args.rate), "--latency-ms", str(args.latency_ms), "--report", "3600"],
+        stdout=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + args.timeout
+    while scrape(api_port, "/stats") is None and time.monotonic() < deadline:
+        time.sleep(0.1)  # the stand-in server builds its updates before it listens
+    env = dict(
+        os.environ,
+        TELEGRAM_API_BASE=f"http://127.0.0.1:{api_port}",
+        PORT=str(bot_port),
+        STATE_DB_PATH=os.path.join(tmp, "state.db"),
+        SNAPSHOT_PATH=os.path.join(tmp, "snapshot.pickle"),
+        SHUTDOWN_DRAIN_TIMEOUT=str(drain),
+        OUTBOUND_RATE="1000000", OUTBOUND_CHAT_RATE="1000000", OUTBOUND_CHAT_BURST="1000000",
+        LOG_LEVEL="ERROR",
+    )
+    bot = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(HERE), "bot.py")], env=env)
+    try:
+        if wait_for(bot_port, CHECKED_RE, args.timeout) is None:
+            return None
+        time.sleep(args.warmup)
+        bot.send_signal(signal.SIGHUP)
+        return wait_for(bot_port, READY_RE, args.timeout)
+    finally:
+        bot.terminate()
+        bot.wait()
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--drain", type=float, nargs="+", default=[20, 0], help="SHUTDOWN_DRAIN_TIMEOUT values")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=300, help="updates/sec replayed")
+    parser.add_argument("--latency-ms", type=float, default=30, help="stand-in API latency")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of traffic before the restart")
+    parser.add_argument("--port", type=int, default=18091, help="stand-in API port (bot uses port + 10)")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds allowed per wait")
+    args = parser.parse_args()
+
+    print(f"link_spam at {args.rate:g} updates/s, {args.latency_ms:g} ms API latency, {args.runs} runs each")
+    print(f"{'drain s':>8} {'ready s (median)':>17} {'min':>7} {'max':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for drain in args.drain:
+            results = [run(drain, args, tmp) for _ in range(args.runs)]
+            ready = [value for value in results if value is not None]
+            if not ready:
+                print(f"{drain:>8g} {'timed out':>17}")
+                continue
+            print(f"{drain:>8g} {statistics.median(ready):>17.2f} {min(ready):>7.2f} {max(ready):>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
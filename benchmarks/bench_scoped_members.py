@@ -0,0 +1,92 @@
+"""Memory and lookup cost of per-chat whitelist/approval storage.
+
+Stores --entries (chat, user) pairs spread over --chats groups (a few large
+groups, many small ones) as a dict of Python sets per chat and as the bot's
+ScopedMembers (sorted int64 arrays), and reports bytes used and the cost of the
+filter_messages exemption check.
+
+    python benchmarks/bench_scoped_members.py [--entries 1000000] [--chats 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+
+def build_entries(count, chats, seed=5):
+    rng = random.Random(seed)
+    chat_ids = [-1001000000000 - index for index in range(chats)]
+    weights = [1 / (rank + 1) for rank in range(chats)]  # Zipf-like group sizes
+    pairs = set()
+    while len(pairs) < count:
+        for chat_id in rng.choices(chat_ids, weights, k=count - len(pairs)):
+            pairs.add((chat_id, rng.randrange(10**9, 8 * 10**9)))
+    return list(pairs)
+
+
+def measure(build):
+    tracemalloc.start()
+    structure = build()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return structure, used
+
+
+def build_sets(entries):
+    by_chat = {}
+    for chat_id, user_id in entries:
+        by_chat.setdefault(chat_id, set()).add(user_id)
+    return by_chat
+
+
+def build_scoped(entries):
+    members = bot.ScopedMembers()
+    members.load(entries)
+    return members
+
+
+def lookup_ns(check, probes):
+    start = time.perf_counter()
+    for chat_id, user_id in probes:
+        check(chat_id, user_id)
+    return (time.perf_counter() - start) / len(probes) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1000000)
+    parser.add_argument("--chats", type=int, default=20000)
+    args = parser.parse_args()
+
+    entries = build_entries(args.entries, args.chats)
+    sets, sets_bytes = measure(lambda: build_sets(entries))
+    scoped, scoped_bytes = measure(lambda: build_scoped(entries))
+
+    rng = random.Random(9)
+    probes = rng.sample(entries, 50000) + [(chat_id, user_id + 1) for chat_id, user_id in rng.sample(entries, 50000)]
+    rng.shuffle(probes)
+
+    def set_check(chat_id, user_id):
+        members = sets.get(chat_id)
+        global_members = sets.get(bot.GLOBAL_SCOPE)
+        return (members is not None and user_id in members) or \
+            (global_members is not None and user_id in global_members)
+
+    print(f"{len(entries):,} (chat, user) entries in {len(sets):,} chats")
+    print(f"{'storage':<22} {'bytes':>14} {'bytes/entry':>12} {'lookup ns':>10}")
+    for name, used, check in (
+        ("dict of sets", sets_bytes, set_check),
+        ("ScopedMembers", scoped_bytes, scoped.allows),
+    ):
+        print(f"{name:<22} {used:>14,} {used / len(entries):>12.1f} {lookup_ns(check, probes):>10.0f}")
+    print(f"ScopedMembers.nbytes(): {scoped.nbytes():,}")
+
+
+if __name__ == "__main__":
+    main()
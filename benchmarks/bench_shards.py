@@ -0,0 +1,115 @@
+"""Throughput of bot.py with 1..N shard worker processes against the stand-in Bot API.
+
+For each worker count the stand-in server (fake_api_server.py) is started with
+a pre-generated backlog of group messages, bot.py is started against it with
+SHARD_WORKERS set (0 = the single-process bot), and the messages_checked
+counters on the /metrics endpoints are polled until the whole backlog has been
+moderated. Outbound rate limits are lifted so the run measures CPU, not pacing.
+Scaling needs as many free cores as processes (front + workers + server).
+
+    python benchmarks/bench_shards.py [--workers 4] [--messages 20000]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from bench_pipeline import build_updates  # noqa: E402
+
+CHECKED_RE = re.compile(r"^antilink_messages_checked_total (\S+)$", re.MULTILINE)
+
+
+def checked(ports):
+    total = 0
+    for port in ports:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1) as response:
+                match = CHECKED_RE.search(response.read().decode())
+        except OSError:
+            return None
+        total += int(float(match.group(1))) if match else 0
+    return total
+
+
+def run(workers, args, replay_path, tmp):
+    api_port, bot_port = args.port, args.port + 10
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "fake_api_server.py"), "--port", str(api_port),
+         "--replay", replay_path, "--rate", "0", "--report", "3600"],
+        stdout=subprocess.DEVNULL
+    )
+    env = dict(
+        os.environ,
+        TELEGRAM_API_BASE=f"http://127.0.0.1:{api_port}",
+        SHARD_WORKERS=str(workers),
+        PORT=str(bot_port),
+        STATE_DB_PATH=os.path.join(tmp, f"state-{workers}.db"),
+        OUTBOUND_RATE="1000000", OUTBOUND_CHAT_RATE="1000000", OUTBOUND_CHAT_BURST="1000000",
+        LOG_LEVEL="ERROR",
+    )
+    bot = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(HERE), "bot.py")], env=env)
+    ports = [bot_port] if workers == 0 else [bot_port + 1 + index for index in range(workers)]
+
+    first_at = first_count = None
+    deadline = time.monotonic() + args.timeout
+    done = 0
+    try:
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            done = checked(ports)
+            if not done:
+                continue
+            if first_at is None:
+                first_at, first_count = time.monotonic(), done
+            if done >= args.messages:
+                break
+        elapsed = time.monotonic() - first_at if first_at else 0
+    finally:
+        bot.terminate()
+        bot.wait()
+        server.terminate()
+        server.wait()
+    if not elapsed or done < args.messages:
+        return None
+    return (done - first_count) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="largest worker count")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--port", type=int, default=18081, help="stand-in API port (bot uses port + 10..)")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds allowed per run")
+    args = parser.parse_args()
+
+    updates, _ = build_updates("clean", args.messages, args.chats, 500)
+    print(f"{args.messages} clean group messages across {args.chats} chats, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'msg/s':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        replay_path = os.path.join(tmp, "updates.jsonl")
+        with open(replay_path, "w") as f:
+            for update in updates:
+                update["update_id"] += 1
+                f.write(json.dumps(update) + "\n")
+        baseline = None
+        for workers in [0, *range(1, args.workers + 1)]:
+            rate = run(workers, args, replay_path, tmp)
+            label = "single" if workers == 0 else str(workers)
+            if rate is None:
+                print(f"{label:>8} {'timed out':>10}")
+                continue
+            baseline = baseline or rate
+            print(f"{label:>8} {rate:>10,.0f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Hot-path overhead of the write-behind state store under a sustained violation rate.
+
+Compares recording a warning in memory only, with write-behind marking (the
+bot's path), and with a synchronous SQLite write per violation. Then runs the
+bot's flush loop against a temporary database while violations arrive at
+--rate per second and reports flush cost and event-loop lag.
+
+    python benchmarks/bench_state_store.py [--rate 2000] [--seconds 10]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+CHAT_ID = -1001000000000
+
+
+def hot_path(store, users, mode):
+    warning_store = bot.warning_store
+    start = time.perf_counter()
+    for user_id in users:
+        warning_store.add(CHAT_ID, user_id)
+        if mode == "write-behind":
+            store.mark("warnings", (CHAT_ID, user_id))
+        elif mode == "write-through":
+            with store._conn:
+                store._conn.execute("INSERT OR REPLACE INTO warnings VALUES (?, ?, ?, ?)",
+                                    (CHAT_ID, user_id, *warning_store.get_raw((CHAT_ID, user_id))))
+    return (time.perf_counter() - start) / len(users) * 1e9
+
+
+async def sustained(store, rate, seconds, user_count):
+    rng = random.Random(7)
+    flush_times = []
+    lags = []
+    original_flush = store.flush
+
+    async def timed_flush():
+        start = time.perf_counter()
+        await original_flush()
+        flush_times.append(time.perf_counter() - start)
+
+    store.flush = timed_flush
+    flusher = asyncio.create_task(store.run())
+
+    async def lag_probe():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - start - 0.005)
+
+    probe = asyncio.create_task(lag_probe())
+    tick = 0.01
+    per_tick = max(1, int(rate * tick))
+    violations = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(per_tick):
+            user_id = rng.randrange(user_count)
+            bot.warning_store.add(CHAT_ID, user_id)
+            store.mark("warnings", (CHAT_ID, user_id))
+        violations += per_tick
+        await asyncio.sleep(tick)
+
+    flusher.cancel()
+    probe.cancel()
+    store.flush = original_flush
+    await store.flush()
+    return violations, flush_times, lags
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        store = bot.StateStore(os.path.join(tmp, "bench.db"))
+        store.open()
+        bot.state_store = store
+        users = [random.randrange(args.users) for _ in range(50000)]
+
+        print("Per-violation hot-path cost:")
+        for mode in ("memory only", "write-behind", "write-through"):
+            sample = users if mode != "write-through" else users[:5000]
+            print(f"  {mode:<14} {hot_path(store, sample, mode):>12,.0f} ns")
+        await store.flush()
+
+        print(f"\nSustained {args.rate}/s for {args.seconds}s, flush every {bot.STATE_FLUSH_INTERVAL}s:")
+        violations, flush_times, lags = await sustained(store, args.rate, args.seconds, args.users)
+        print(f"  violations recorded: {violations}")
+        print(f"  flushes:             {store.flushes} ({store.rows_written} rows)")
+        print(f"  flush p50 / max:     {percentile(flush_times, 50) * 1000:.1f} / {max(flush_times, default=0) * 1000:.1f} ms")
+        print(f"  loop lag p99 / max:  {percentile(lags, 99) * 1000:.2f} / {max(lags, default=0) * 1000:.2f} ms")
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=int, default=2000, help="violations per second")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--users", type=int, default=100000, help="distinct offending users")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Local stand-in for the Bot API, for end-to-end load tests of bot.py over HTTP.
+
+Serves /bot<token>/<method> from the in-process FakeTelegram (benchmarks/fake_bot.py)
+and replays a synthetic update stream (the bench_pipeline scenarios, or a JSONL
+file of updates) at --rate updates/sec. Updates are handed out through
+getUpdates, or POSTed to the webhook registered with setWebhook. Latency and
+429 flood errors with retry_after can be injected into every other method.
+
+    python benchmarks/fake_api_server.py --scenario link_spam --rate 200 --flood-rate 0.01 --latency-ms 30
+    TELEGRAM_API_BASE=http://127.0.0.1:8081 python bot.py
+
+or start the bot against it directly with --run-bot. Call counts are printed
+every --report seconds and served at /stats.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from bench_pipeline import SCENARIOS, build_updates  # noqa: E402
+from fake_bot import FakeTelegram  # noqa: E402
+
+
+class FakeApiServer:
+    def __init__(self, telegram, updates, rate, latency=0.0, jitter=0.0):
+        self.telegram = telegram
+        self.source = updates
+        self.rate = rate
+        self.latency = latency
+        self.jitter = jitter
+        self.pending = collections.deque()  # updates not yet confirmed via getUpdates offset
+        self.available = asyncio.Event()
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.replayed = 0
+        self.delivered = 0
+        self.webhook_errors = 0
+        self.started = time.monotonic()
+
+    async def _params(self, request):
+        # aiogram sends multipart/urlencoded forms; nested values are JSON strings
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        params.update(request.query)
+        return params
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        params = await self._params(request)
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self.get_updates(params)})
+        if method == "setWebhook":
+            self.webhook_url = params.get("url") or None
+            self.webhook_secret = params.get("secret_token")
+        elif method == "deleteWebhook":
+            self.webhook_url = None
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        status, payload = self.telegram.handle(method, params)
+        return web.json_response(payload, status=status)
+
+    async def get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        while self.pending and self.pending[0]["update_id"] < offset:
+            self.pending.popleft()
+        if not self.pending and timeout:
+            self.available.clear()
+            try:
+                await asyncio.wait_for(self.available.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        batch = [update for _, update in zip(range(limit), self.pending)]
+        self.delivered = max(self.delivered, batch[-1]["update_id"] + 1 if batch else 0)
+        return batch
+
+    async def replay(self):
+        # Emit updates at a steady rate, stamped with the time they are sent
+        interval = 1 / self.rate if self.rate > 0 else 0
+        next_at = time.monotonic()
+        async with aiohttp.ClientSession() as session:
+            for update in self.source:
+                if interval:
+                    next_at += interval
+                    delay = next_at - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                update["message"]["date"] = int(time.time())
+                self.replayed += 1
+                if self.webhook_url:
+                    asyncio.create_task(self.post_webhook(session, update))
+                else:
+                    self.pending.append(update)
+                    self.available.set()
+
+    async def post_webhook(self, session, update):
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret} if self.webhook_secret else {}
+        try:
+            async with session.post(self.webhook_url, json=update, headers=headers) as response:
+                if response.status != 200:
+                    self.webhook_errors += 1
+        except aiohttp.ClientError:
+            self.webhook_errors += 1
+
+    def stats(self):
+        return {
+            "uptime": round(time.monotonic() - self.started, 1),
+            "replayed": self.replayed,
+            "delivered": self.delivered,
+            "webhook_errors": self.webhook_errors,
+            "floods": self.telegram.floods,
+            "calls": dict(self.telegram.calls),
+        }
+
+    async def handle_stats(self, request):
+        return web.json_response(self.stats())
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        app.router.add_get("/stats", self.handle_stats)
+        return app
+
+
+def load_updates(args):
+    if args.replay:
+        with open(args.replay) as f:
+            updates = [json.loads(line) for line in f if line.strip()]
+        return updates, (lambda user_id: "")
+    updates, bio_for = build_updates(args.scenario, args.count, args.chats, args.users)
+    for update in updates:
+        update["update_id"] += 1  # offset 0 must not confirm the first update
+    return updates, bio_for
+
+
+async def run(args):
+    updates, bio_for = load_updates(args)
+    telegram = FakeTelegram(admins=tuple(args.admin), bio_for=bio_for, flood_rate=args.flood_rate,
+                            retry_after=args.retry_after)
+    server = FakeApiServer(telegram, updates, args.rate, args.latency_ms / 1000, args.jitter_ms / 1000)
+    runner = web.AppRunner(server.build_app())
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.port).start()
+    base = f"http://{args.host}:{args.port}"
+    print(f"Stand-in Bot API on {base} ({len(updates)} updates at {args.rate}/s)", flush=True)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    bot_process = None
+    if args.run_bot:
+        tmp = tempfile.mkdtemp()
+        env = dict(os.environ, TELEGRAM_API_BASE=base, STATE_DB_PATH=os.path.join(tmp, "bot_state.db"))
+        bot_process = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(HERE), "bot.py")], env=env)
+
+    replay = asyncio.create_task(server.replay())
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), args.report)
+        except asyncio.TimeoutError:
+            print(json.dumps(server.stats()), flush=True)
+        if bot_process and bot_process.poll() is not None:
+            break
+
+    replay.cancel()
+    if bot_process and bot_process.poll() is None:
+        bot_process.terminate()
+        try:
+            await asyncio.to_thread(bot_process.wait, 30)
+        except subprocess.TimeoutExpired:
+            bot_process.kill()
+    print(json.dumps(server.stats()), flush=True)
+    await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--scenario", choices=SCENARIOS, default="link_spam")
+    parser.add_argument("--replay", help="JSONL file of updates to replay instead of a scenario")
+    parser.add_argument("--count", type=int, default=10000, help="synthetic updates to generate")
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=100, help="updates/sec replayed (0 = all at once)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="added to every method except getUpdates")
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="share of calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after sent with injected 429s")
+    parser.add_argument("--admin", type=int, action="append", default=[1], help="user ids reported as admins")
+    parser.add_argument("--report", type=float, default=5, help="seconds between stats lines")
+    parser.add_argument("--run-bot", action="store_true", help="start bot.py pointed at this server")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
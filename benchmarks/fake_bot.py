@@ -0,0 +1,124 @@
+"""In-process fake of the Bot API subset bot.py uses.
+
+FakeTelegram answers Bot API methods from memory, recording every call, and
+can inject flood errors (429 with retry_after). FakeSession plugs it into the
+real aiogram Bot in place of the HTTP session, adding simulated latency, so
+handlers run unchanged, including the bot's request middlewares.
+"""
+import asyncio
+import collections
+import itertools
+import json
+import random
+import time
+
+from aiogram.client.session.base import BaseSession
+
+BOT_USER = {"id": 7000000001, "is_bot": True, "first_name": "Links Shield", "username": "links_shield_bot"}
+
+
+class FakeTelegram:
+    def __init__(self, admins=(1,), bio_for=None, flood_rate=0.0, retry_after=1, seed=0):
+        self.admins = admins
+        self.bio_for = bio_for or (lambda user_id: "")
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.calls = collections.Counter()
+        self.floods = 0
+        self._message_ids = itertools.count(1000000)
+        self._rng = random.Random(seed)
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def _chat(self, chat_id):
+        if chat_id > 0:
+            return {"id": chat_id, "type": "private", "first_name": f"User{chat_id}"}
+        return {"id": chat_id, "type": "supergroup", "title": f"Group {chat_id}"}
+
+    def _message(self, chat_id, text=None):
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": self._chat(chat_id),
+            "from": BOT_USER,
+        }
+        if text is not None:
+            message["text"] = text
+        return message
+
+    def handle(self, method, params):
+        """Return (status_code, response dict) for one Bot API call."""
+        self.calls[method] += 1
+        if self.flood_rate and self._rng.random() < self.flood_rate:
+            self.floods += 1
+            return 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+
+        chat_id = params.get("chat_id")
+        if isinstance(chat_id, str):
+            chat_id = int(chat_id)
+        if method in ("sendMessage", "sendPhoto", "editMessageText"):
+            result = self._message(chat_id, params.get("text") or params.get("caption") or "")
+        elif method == "copyMessage":
+            result = {"message_id": next(self._message_ids)}
+        elif method == "getChat":
+            result = self._chat(chat_id)
+            if chat_id > 0:
+                result["bio"] = self.bio_for(chat_id)
+        elif method == "getChatMember":
+            user_id = int(params["user_id"])
+            status = "administrator" if user_id in self.admins else "member"
+            result = {"status": status, "user": self._user(user_id)}
+            if status == "administrator":
+                result.update(can_be_edited=False, is_anonymous=False, can_manage_chat=True,
+                              can_delete_messages=True, can_manage_video_chats=True,
+                              can_restrict_members=True, can_promote_members=False,
+                              can_change_info=True, can_invite_users=True)
+        elif method == "getChatAdministrators":
+            result = [{"status": "creator", "user": self._user(user_id), "is_anonymous": False}
+                      for user_id in self.admins]
+        elif method == "getMe":
+            result = dict(BOT_USER, can_join_groups=True, can_read_all_group_messages=True,
+                          supports_inline_queries=False)
+        elif method in ("deleteMessage", "deleteMessages", "restrictChatMember", "answerCallbackQuery",
+                        "setWebhook", "deleteWebhook", "banChatMember"):
+            result = True
+        else:
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+        return 200, {"ok": True, "result": result}
+
+
+class FakeSession(BaseSession):
+    def __init__(self, telegram, latency=0.0, jitter=0.0):
+        super().__init__()
+        self.telegram = telegram
+        self.latency = latency
+        self.jitter = jitter
+
+    async def make_request(self, bot, method, timeout=None):
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        params = {key: value for key, value in dict(method).items() if value is not None}
+        status, payload = self.telegram.handle(method.__api_method__, params)
+        response = self.check_response(bot, method, status, json.dumps(payload))
+        return response.result
+
+    def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        # bot.py never downloads files; fail at the call rather than mid-iteration
+        raise RuntimeError(f"FakeSession does not serve file downloads (requested {url})")
+
+    async def close(self):
+        pass
+
+
+def install(bot_module, telegram, latency=0.0, jitter=0.0):
+    # Swap the bot's HTTP session for a FakeSession, keeping its middlewares
+    session = FakeSession(telegram, latency, jitter)
+    session.middleware = bot_module.bot.session.middleware
+    bot_module.bot.session = session
+    return session
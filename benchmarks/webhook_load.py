@@ -0,0 +1,116 @@
+"""Local load test for webhook delivery: POSTs synthetic updates, reports updates/sec and ack latency.
+
+By default the bot's webhook app and update workers are started in-process on
+a free port (no setWebhook call, nothing is sent to Telegram: the synthetic
+messages come from private chats, which the filter ignores). Point --url at a
+running bot to test a real deployment instead.
+
+    python benchmarks/webhook_load.py [--updates 20000] [--concurrency 64]
+    python benchmarks/webhook_load.py --url http://127.0.0.1:8080/webhook --secret <WEBHOOK_SECRET>
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+
+def make_update(update_id, chat_type):
+    chat_id = 100000 + update_id % 500 if chat_type == "private" else -1000000000000 - update_id % 50
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": chat_type, "title": "Load test"},
+            "from": {"id": 100000 + update_id % 500, "is_bot": False, "first_name": "Load"},
+            "text": f"synthetic message number {update_id} hello everyone",
+        },
+    }
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def start_local_server():
+    runner = web.AppRunner(bot.build_webhook_app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}{bot.WEBHOOK_PATH}"
+
+
+async def run(args):
+    runner = workers = None
+    url, secret = args.url, args.secret
+    if not url:
+        runner, url = await start_local_server()
+        secret = bot.WEBHOOK_SECRET
+        workers = bot.update_pipeline.start()
+
+    bodies = [json.dumps(make_update(i, args.chat_type)).encode() for i in range(args.updates)]
+    headers = {"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret}
+    latencies = []
+    statuses = {}
+    next_index = 0
+
+    async def client(session):
+        nonlocal next_index
+        while next_index < len(bodies):
+            body = bodies[next_index]
+            next_index += 1
+            start = time.perf_counter()
+            async with session.post(url, data=body, headers=headers) as response:
+                await response.read()
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+            latencies.append(time.perf_counter() - start)
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        if workers:
+            await bot.update_pipeline.join()
+        processed = time.perf_counter() - start
+
+    print(f"updates:        {args.updates}  (concurrency {args.concurrency})")
+    print(f"statuses:       {statuses}")
+    print(f"acked/sec:      {args.updates / elapsed:,.0f}")
+    if workers:
+        print(f"processed/sec:  {statuses.get(200, 0) / processed:,.0f}  (503 = queue full, Telegram would redeliver)")
+    print(f"ack p50:        {percentile(latencies, 50) * 1000:.2f} ms")
+    print(f"ack p99:        {percentile(latencies, 99) * 1000:.2f} ms")
+
+    if workers:
+        for worker in workers:
+            worker.cancel()
+    if runner:
+        await runner.cleanup()
+    await bot.bot.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="webhook URL of a running bot (default: start one in-process)")
+    parser.add_argument("--secret", default=bot.WEBHOOK_SECRET, help="secret token sent with each update")
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--chat-type", default="private", choices=("private", "supergroup"),
+                        help="supergroup updates make API calls; use with a stand-in Bot API server")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
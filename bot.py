@@ -3,12 +3,39 @@ import time
 import asyncio
 import os
 import sys
+import signal
+import hashlib
+import hmac
+import heapq
+import contextvars
+import bisect
+import logging
+import logging.handlers
+import queue
+import random
+import copy
+import itertools
+from array import array
+import multiprocessing
+import json
+import pickle
+import sqlite3
+import unicodedata
+from collections import OrderedDict, deque
+from typing import List, Optional, Union
+from urllib.parse import urlsplit
+import aiohttp
+from aiohttp import web
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
 from aiogram.enums import ChatMemberStatus
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.exceptions import TelegramBadRequest, TelegramNotFound, TelegramRetryAfter
+from aiogram.methods.base import TelegramMethod
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
 # Load environment variables
 load_dotenv()
@@ -16,10 +43,105 @@ load_dotenv()
 # ===== CONFIG =====
 API_TOKEN = os.getenv("BOT_TOKEN", "8470214636:AAExm5uh4tu621S5zvHDMDfWQzxruvgvuwY")
 BOT_OWNER_ID = int(os.getenv("OWNER_ID", "6156257558"))  # YOUR OWNER ID
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "")  # e.g. a local Bot API server; empty = api.telegram.org
 OWNER_USERNAME = os.getenv("OWNER_USERNAME", "Insaanova")
 UPDATES_USERNAME = os.getenv("UPDATES_USERNAME", "FRIENDS_CORNER_CHATTING_GROUP")
 LOG_CHAT_ID = int(os.getenv("LOG_CHAT_ID", "-1003086724642"))
 BROADCAST_SOURCE_CHANNEL = int(os.getenv("BROADCAST_SOURCE_CHANNEL", "-1002933746046"))  # APNA SOURCE CHANNEL ID
+LOG_DIGEST_INTERVAL = float(os.getenv("LOG_DIGEST_INTERVAL", "30"))  # seconds between moderation log digests
+LOG_DIGEST_MAX_EVENTS = int(os.getenv("LOG_DIGEST_MAX_EVENTS", "200"))  # send early once this many events are queued
+LOG_DIGEST_MAX_GROUPS = int(os.getenv("LOG_DIGEST_MAX_GROUPS", "100"))  # (chat, type) lines kept per digest
+LOG_DIGEST_SAMPLE_USERS = int(os.getenv("LOG_DIGEST_SAMPLE_USERS", "3"))  # users named per line
+BIO_CACHE_SIZE = int(os.getenv("BIO_CACHE_SIZE", "50000"))  # max cached users
+BIO_CACHE_TTL = int(os.getenv("BIO_CACHE_TTL", "600"))  # seconds a bio result stays fresh
+BIO_CACHE_NEGATIVE_TTL = int(os.getenv("BIO_CACHE_NEGATIVE_TTL", "60"))  # seconds to remember failed lookups
+ADMIN_CACHE_TTL = int(os.getenv("ADMIN_CACHE_TTL", "900"))  # seconds before an admin roster is reloaded
+ADMIN_CACHE_NEGATIVE_TTL = int(os.getenv("ADMIN_CACHE_NEGATIVE_TTL", "60"))  # retry delay after a failed load
+MEMBER_DIRECTORY_SIZE = int(os.getenv("MEMBER_DIRECTORY_SIZE", "100000"))  # users remembered for @username lookups
+JOIN_PREFETCH = os.getenv("JOIN_PREFETCH", "on").lower() == "on"  # warm bio/admin caches when a member joins
+JOIN_PREFETCH_MAX_TASKS = int(os.getenv("JOIN_PREFETCH_MAX_TASKS", "200"))  # concurrent prefetches before skipping
+JOIN_BIO_ACTION = os.getenv("JOIN_BIO_ACTION", "none").lower()  # none | mute: joiners with bio links
+
+# Update delivery: "polling" (getUpdates) or "webhook" (embedded aiohttp server)
+DELIVERY_MODE = os.getenv("DELIVERY_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", os.getenv("RENDER_EXTERNAL_URL", ""))  # public base URL
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", hashlib.sha256(API_TOKEN.encode()).hexdigest()[:32])
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8080"))
+WEBHOOK_FALLBACK_POLLING = os.getenv("WEBHOOK_FALLBACK_POLLING", "on").lower() == "on"
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "on").lower() == "on"  # serve /metrics on PORT
+
+# Update processing (all delivery modes): worker pool, queue bound and the
+# queue fill (0-1) at which each optional stage is skipped
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", os.getenv("WEBHOOK_WORKERS", "32")))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", os.getenv("WEBHOOK_QUEUE_SIZE", "1000")))
+LOAD_SHED = {
+    stage.strip(): float(fill)
+    for stage, fill in (item.split("=") for item in
+                        os.getenv("LOAD_SHED", "bio_check=0.5,join_prefetch=0.75,fingerprint=0.9").split(",") if item)
+}
+
+# Sharding: >0 routes updates by chat_id to this many worker processes
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "0"))
+SHARD_QUEUE_SIZE = int(os.getenv("SHARD_QUEUE_SIZE", "1000"))  # updates buffered per worker
+
+# Logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # json | text
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))  # share of per-message debug events kept
+LOG_ERROR_LIMIT = int(os.getenv("LOG_ERROR_LIMIT", "5"))  # identical errors logged per window
+LOG_ERROR_WINDOW = float(os.getenv("LOG_ERROR_WINDOW", "60"))  # seconds
+
+# Outbound Bot API requests
+OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", "30"))  # sends/sec across all chats
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))  # sends/sec into one chat
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "5"))  # sends into one chat before pacing starts
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))  # retries after a flood wait (retry_after)
+OUTBOUND_WARNING_MAX_AGE = float(os.getenv("OUTBOUND_WARNING_MAX_AGE", "30"))  # drop warning replies queued longer
+
+# Broadcasts
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # share of OUTBOUND_RATE broadcasts may use
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5"))  # seconds between progress edits
+
+# Detection
+ENTITY_DETECTION = os.getenv("ENTITY_DETECTION", "on").lower() == "on"  # classify from Telegram's entities when present
+DOMAIN_LIST_LIMIT = int(os.getenv("DOMAIN_LIST_LIMIT", "500"))  # allowed + blocked domains per group
+
+# Backlog catch-up after downtime
+CATCHUP = os.getenv("CATCHUP", "on").lower() == "on"
+CATCHUP_AGE = float(os.getenv("CATCHUP_AGE", "60"))  # seconds after which a message counts as backlog
+CATCHUP_QUIET = float(os.getenv("CATCHUP_QUIET", "2"))  # seconds without backlog before a chat's summary
+
+# Raid mode
+RAID_MODE = os.getenv("RAID_MODE", "on").lower() == "on"
+RAID_THRESHOLD = float(os.getenv("RAID_THRESHOLD", "3"))  # violations/sec in one group that start a raid
+RAID_WINDOW = float(os.getenv("RAID_WINDOW", "5"))  # seconds the violation rate is measured over
+RAID_COOLDOWN = float(os.getenv("RAID_COOLDOWN", "30"))  # seconds without violations that end a raid
+RAID_MUTE_STRIKES = int(os.getenv("RAID_MUTE_STRIKES", "2"))  # deleted messages before a raider is muted
+RAID_BATCH_INTERVAL = float(os.getenv("RAID_BATCH_INTERVAL", "1"))  # seconds deletes and mutes are batched for
+
+# Cross-chat spam waves
+WAVE_DETECTION = os.getenv("WAVE_DETECTION", "on").lower() == "on"
+WAVE_WINDOW = float(os.getenv("WAVE_WINDOW", "120"))  # seconds a text is remembered after it was last seen
+WAVE_CHAT_THRESHOLD = int(os.getenv("WAVE_CHAT_THRESHOLD", "3"))  # groups a text must hit to count as a wave
+WAVE_MIN_SENDERS = int(os.getenv("WAVE_MIN_SENDERS", "2"))  # distinct senders a wave needs (one user forwarding is not one)
+WAVE_MIN_CHARS = int(os.getenv("WAVE_MIN_CHARS", "30"))  # shorter (normalised) texts are not tracked
+WAVE_MAX_DISTANCE = int(os.getenv("WAVE_MAX_DISTANCE", "6"))  # SimHash bits two near-duplicates may differ by
+WAVE_FLAG_TTL = float(os.getenv("WAVE_FLAG_TTL", "1800"))  # seconds a wave sender stays flagged in every group
+WAVE_MAX_TRACKED = int(os.getenv("WAVE_MAX_TRACKED", "20000"))  # distinct texts tracked at once
+
+# Warnings
+WARNING_LIMIT = int(os.getenv("WARNING_LIMIT", "3"))  # strikes in one group before a mute
+WARNING_HALF_LIFE = float(os.getenv("WARNING_HALF_LIFE", "21600"))  # seconds for a strike to fade to half
+WARNING_STORE_SIZE = int(os.getenv("WARNING_STORE_SIZE", "100000"))  # (chat, user) pairs tracked
+
+# Persistence
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "bot_state.db")
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "2"))  # seconds between write-behind flushes
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "bot_snapshot.pickle")  # in-memory state handed to the next process; empty = off
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "20"))  # seconds to finish queued work on stop/restart
 
 # Dynamic buttons storage (in-memory)
 dynamic_buttons = [
@@ -28,98 +150,1952 @@ dynamic_buttons = [
     {"text": "❓ Help & Commands", "callback_data": "help"}
 ]
 
-warnings = {}
-whitelist = set()
-approved_users = set()  # For approveme command
+# --- Scoped Membership ---
+# Whitelist and approvals apply per chat. Each chat keeps its user ids in a
+# sorted array of 64-bit ints (8 bytes per entry) searched with bisect.
+# GLOBAL_SCOPE holds entries valid in every chat, such as rows stored before
+# membership was scoped.
+GLOBAL_SCOPE = 0
+
+class ScopedMembers:
+    def __init__(self):
+        self._chats = {}  # chat_id: array('q') of sorted user ids
+
+    def contains(self, chat_id: int, user_id: int) -> bool:
+        members = self._chats.get(chat_id)
+        if members is None:
+            return False
+        index = bisect.bisect_left(members, user_id)
+        return index < len(members) and members[index] == user_id
+
+    def allows(self, chat_id: int, user_id: int) -> bool:
+        # Listed in this chat or globally (hot path: contains() inlined)
+        for members in (self._chats.get(chat_id), self._chats.get(GLOBAL_SCOPE)):
+            if members is not None:
+                index = bisect.bisect_left(members, user_id)
+                if index < len(members) and members[index] == user_id:
+                    return True
+        return False
+
+    def add(self, chat_id: int, user_id: int) -> bool:
+        members = self._chats.get(chat_id)
+        if members is None:
+            members = self._chats[chat_id] = array("q")
+        index = bisect.bisect_left(members, user_id)
+        if index < len(members) and members[index] == user_id:
+            return False
+        members.insert(index, user_id)
+        return True
+
+    def discard(self, chat_id: int, user_id: int) -> bool:
+        members = self._chats.get(chat_id)
+        if members is None:
+            return False
+        index = bisect.bisect_left(members, user_id)
+        if index == len(members) or members[index] != user_id:
+            return False
+        del members[index]
+        if not members:
+            del self._chats[chat_id]
+        return True
+
+    def members(self, chat_id: int):
+        return self._chats.get(chat_id, ())
+
+    def visible(self, chat_id: int) -> set:
+        # User ids that apply in chat_id, including global entries
+        return set(self.members(chat_id)) | set(self.members(GLOBAL_SCOPE))
+
+    def entries(self):
+        for chat_id, members in self._chats.items():
+            for user_id in members:
+                yield chat_id, user_id
+
+    def load(self, entries):
+        # Replace the contents with (chat_id, user_id) pairs
+        by_chat = {}
+        for chat_id, user_id in entries:
+            by_chat.setdefault(chat_id, set()).add(user_id)
+        self._chats = {chat_id: array("q", sorted(user_ids)) for chat_id, user_ids in by_chat.items()}
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self._chats) + sum(sys.getsizeof(members) for members in self._chats.values())
+
+    def __len__(self):
+        return sum(len(members) for members in self._chats.values())
+
+    def __bool__(self):
+        return bool(self._chats)
+
+# --- Warning Store ---
+# Strikes per (chat, user). A strike counts 1 when given and halves every
+# WARNING_HALF_LIFE seconds; a user's strike count is their score rounded.
+# All scores decay at the same rate, so the total over all users is one
+# decayed running sum, read in O(1). Faded entries are dropped from the old
+# end of the LRU, and beyond WARNING_STORE_SIZE the least recently warned go.
+WARNING_IDLE_SCORE = 0.05
+
+class WarningStore:
+    def __init__(self, maxsize: int, half_life: float, on_evict=None):
+        self.maxsize = maxsize
+        self.half_life = half_life
+        self.on_evict = on_evict  # called with each (chat_id, user_id) dropped
+        self._entries = OrderedDict()  # (chat_id, user_id): [score, updated_at]
+        self._total = 0.0
+        self._total_at = time.time()
+        self.issued = 0
+
+    def _decay(self, score: float, since: float, now: float) -> float:
+        return score * 0.5 ** (max(0.0, now - since) / self.half_life)
+
+    def score(self, chat_id: int, user_id: int, now=None) -> float:
+        entry = self._entries.get((chat_id, user_id))
+        if entry is None:
+            return 0.0
+        return self._decay(entry[0], entry[1], now or time.time())
+
+    def count(self, chat_id: int, user_id: int) -> int:
+        return int(self.score(chat_id, user_id) + 0.5)
+
+    def add(self, chat_id: int, user_id: int, now=None) -> int:
+        # Record a strike and return the current strike count
+        now = now or time.time()
+        key = (chat_id, user_id)
+        entry = self._entries.get(key)
+        score = 1.0 if entry is None else self._decay(entry[0], entry[1], now) + 1
+        self._entries[key] = [score, now]
+        self._entries.move_to_end(key)
+        self._total = self.total(now) + 1
+        self._total_at = now
+        self.issued += 1
+        self._evict(now)
+        return int(score + 0.5)
+
+    def reset(self, chat_id: int, user_id: int, now=None):
+        entry = self._entries.pop((chat_id, user_id), None)
+        if entry is not None:
+            self._forget(entry, now or time.time())
+
+    def _forget(self, entry, now: float):
+        self._total = max(0.0, self.total(now) - self._decay(entry[0], entry[1], now))
+        self._total_at = now
+
+    def _evict(self, now: float):
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if len(self._entries) <= self.maxsize and self._decay(entry[0], entry[1], now) >= WARNING_IDLE_SCORE:
+                break
+            del self._entries[key]
+            self._forget(entry, now)
+            if self.on_evict is not None:
+                self.on_evict(key)
+
+    def total(self, now=None) -> float:
+        return self._decay(self._total, self._total_at, now or time.time())
+
+    def get_raw(self, key):
+        # (score, updated_at) as stored, for persistence
+        entry = self._entries.get(key)
+        return None if entry is None else tuple(entry)
+
+    def restore(self, rows):
+        now = time.time()
+        for chat_id, user_id, score, updated_at in sorted(rows, key=lambda row: row[3]):
+            if self._decay(score, updated_at, now) >= WARNING_IDLE_SCORE:
+                self._entries[(chat_id, user_id)] = [score, updated_at]
+                self._total = self.total(now) + self._decay(score, updated_at, now)
+                self._total_at = now
+        self._evict(now)
+
+    def __len__(self):
+        return len(self._entries)
+
+warning_store = WarningStore(WARNING_STORE_SIZE, WARNING_HALF_LIFE,
+                             on_evict=lambda key: state_store.mark("warnings", key))
+whitelist = ScopedMembers()
+approved_users = ScopedMembers()  # For approveme command
 group_settings = {}  # chat_id: settings
 mute_duration = 5  # minutes
-user_bio_cache = {}  # Cache user bios to avoid frequent API calls
 maintenance_active = False
 pending_broadcast = None
+shard_index = None  # set in shard worker processes
 
-bot = Bot(token=API_TOKEN)
+bot = Bot(
+    token=API_TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_BASE)) if TELEGRAM_API_BASE else None,
+)
 dp = Dispatcher()
 
+# --- Logging ---
+# Records go through a QueueHandler and are written by a QueueListener thread,
+# so handlers never block on stdout. Output is one JSON object per line with
+# chat/user/violation fields passed via `extra`.
+logger = logging.getLogger("antilink")
+
+LOG_FIELDS = ("chat_id", "user_id", "violation", "method", "update_id", "event", "error", "suppressed")
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in LOG_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # Like QueueHandler.prepare, but keeps the traceback separate from the
+    # message so the JSON formatter can put it in its own field
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+log_listener = None
+
+def setup_logging():
+    global log_listener
+    if log_listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers[:] = [_QueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+    # aiogram logs every handled update at INFO; keep that for debugging only
+    if LOG_LEVEL != "DEBUG":
+        logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    log_listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    log_listener.start()
+
+def stop_logging():
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+def message_fields(message: types.Message, **fields) -> dict:
+    fields["chat_id"] = message.chat.id
+    fields["user_id"] = message.from_user.id if message.from_user else None
+    return fields
+
+def log_sampled(msg: str, message: types.Message, **fields):
+    # Per-message debug events: kept for LOG_SAMPLE_RATE of messages
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_SAMPLE_RATE:
+        logger.debug(msg, extra=message_fields(message, **fields))
+
+class ErrorRateLimiter:
+    # At most `limit` log lines per key per `window` seconds; the next line
+    # after a quiet period reports how many were suppressed
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self._windows = {}  # key: [window_start, logged, suppressed]
+
+    def allow(self, key):
+        now = time.monotonic()
+        entry = self._windows.get(key)
+        if entry is None or now - entry[0] >= self.window:
+            suppressed = entry[2] if entry else 0
+            self._windows[key] = [now, 1, 0]
+            if len(self._windows) > 1000:
+                self._windows = {k: v for k, v in self._windows.items() if now - v[0] < self.window}
+            return True, suppressed
+        if entry[1] < self.limit:
+            entry[1] += 1
+            return True, 0
+        entry[2] += 1
+        return False, 0
+
+error_rate_limiter = ErrorRateLimiter(LOG_ERROR_LIMIT, LOG_ERROR_WINDOW)
+
+# --- Metrics ---
+# Prometheus-style counters, histograms and gauges, rendered in the text
+# exposition format on GET /metrics.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+metrics_registry = []
+
+def _format_labels(labelnames, labelvalues, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}  # labelvalues: value
+        metrics_registry.append(self)
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labelvalues, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}"
+
+class _Timer:
+    __slots__ = ("histogram", "labelvalues", "start")
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values = {}  # labelvalues: [bucket counts..., +Inf count, sum]
+        metrics_registry.append(self)
+
+    def observe(self, value: float, *labelvalues):
+        series = self._values.get(labelvalues)
+        if series is None:
+            series = self._values[labelvalues] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, *labelvalues):
+        return _Timer(self, labelvalues)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labelvalues, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, 'le="%s"' % bound)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labelvalues)} {series[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labelvalues)} {cumulative}"
+
+class Gauge:
+    # Value is read from a callback at scrape time; kind="counter" exposes a
+    # monotonically increasing attribute kept elsewhere
+    def __init__(self, name: str, documentation: str, callback, kind: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.kind = kind
+        metrics_registry.append(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield f"{self.name} {self.callback()}"
+
+def render_metrics() -> str:
+    lines = []
+    for metric in metrics_registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+STAGE_SECONDS = Histogram("antilink_stage_seconds", "Time spent per moderation stage", ("stage",))
+UPDATE_SECONDS = Histogram("antilink_update_seconds", "Time to handle one update", ("type",))
+UPDATE_WAIT_SECONDS = Histogram("antilink_update_queue_wait_seconds", "Time updates waited in the update pipeline")
+SHED = Counter("antilink_shed_total", "Optional stages skipped under load", ("stage",))
+API_SECONDS = Histogram("antilink_api_seconds", "Bot API request latency, excluding queueing", ("method",))
+OUTBOUND_WAIT_SECONDS = Histogram("antilink_outbound_wait_seconds", "Time requests waited in the outbound scheduler", ("priority",))
+MESSAGES_CHECKED = Counter("antilink_messages_checked_total", "Group messages run through the filter")
+VIOLATIONS = Counter("antilink_violations_total", "Detected violations by type and outcome", ("type", "outcome"))
+API_ERRORS = Counter("antilink_api_errors_total", "Failed Bot API requests", ("method", "error"))
+JOINS = Counter("antilink_joins_total", "Member joins by outcome", ("outcome",))
+RAIDS = Counter("antilink_raids_total", "Raid mode transitions", ("event",))
+CATCHUP_MESSAGES = Counter("antilink_catchup_messages_total", "Backlog messages by outcome", ("outcome",))
+SPAM_WAVES = Counter("antilink_spam_waves_total", "Cross-chat spam waves detected")
+
+# --- State Store ---
+# SQLite (WAL) persistence for settings, warnings, whitelist, approvals,
+# domain lists and pending deletions.
+# Handlers keep working on the in-memory structures above and only mark what
+# changed; a background task writes the dirty keys in one transaction every
+# STATE_FLUSH_INTERVAL seconds on a worker thread, so the hot path never waits
+# on disk.
+class StateStore:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS settings (chat_id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS warnings (
+            chat_id INTEGER NOT NULL, user_id INTEGER NOT NULL, score REAL NOT NULL, updated REAL NOT NULL,
+            PRIMARY KEY (chat_id, user_id)
+        );
+        CREATE TABLE IF NOT EXISTS whitelist (
+            chat_id INTEGER NOT NULL, user_id INTEGER NOT NULL, PRIMARY KEY (chat_id, user_id)
+        );
+        CREATE TABLE IF NOT EXISTS approved_users (
+            chat_id INTEGER NOT NULL, user_id INTEGER NOT NULL, PRIMARY KEY (chat_id, user_id)
+        );
+        CREATE TABLE IF NOT EXISTS domain_lists (
+            chat_id INTEGER NOT NULL, domain TEXT NOT NULL, allowed INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, domain)
+        );
+        CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS deletions (
+            chat_id INTEGER NOT NULL, message_id INTEGER NOT NULL, due REAL NOT NULL,
+            PRIMARY KEY (chat_id, message_id)
+        );
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._lock = asyncio.Lock()
+        self._dirty = {"settings": set(), "warnings": set(), "whitelist": set(), "approved_users": set(),
+                       "domain_lists": set(), "deletions": set()}
+        self._kv = {}  # key: JSON-serialisable value, or None to delete
+        self._data_version = None
+        self._shared_settings = {}  # shard workers: chat_id: settings JSON last read for other workers' groups
+        self.flushes = 0
+        self.rows_written = 0
+
+    def open(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        legacy = self._rename_legacy_tables()
+        self._conn.executescript(self.SCHEMA)
+        with self._conn:
+            for table in legacy:
+                # Unscoped rows stay valid everywhere
+                self._conn.execute(f"INSERT INTO {table} SELECT ?, user_id FROM {table}_legacy", (GLOBAL_SCOPE,))
+                self._conn.execute(f"DROP TABLE {table}_legacy")
+
+    def _rename_legacy_tables(self) -> list:
+        # whitelist/approved_users used to be keyed by user_id alone
+        legacy = []
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(warnings)")]
+        if columns == ["user_id", "count"]:
+            # Unscoped strike counts can't be attributed to a group
+            self._conn.execute("DROP TABLE warnings")
+        for table in ("whitelist", "approved_users"):
+            columns = [row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+            if columns == ["user_id"]:
+                self._conn.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+                legacy.append(table)
+        return legacy
+
+    def load(self):
+        # Fill the module-level structures in place
+        for chat_id, data in self._conn.execute("SELECT chat_id, data FROM settings"):
+            group_settings[chat_id] = self._parse_settings(data)
+            if shard_index is not None and shard_of(chat_id) != shard_index:
+                self._shared_settings[chat_id] = data
+        warnings = self._conn.execute("SELECT chat_id, user_id, score, updated FROM warnings").fetchall()
+        if shard_index is not None:
+            # Another worker's strikes fading here would delete its rows
+            warnings = [row for row in warnings if shard_of(row[0]) == shard_index]
+        warning_store.restore(warnings)
+        whitelist.load(self._conn.execute("SELECT chat_id, user_id FROM whitelist"))
+        approved_users.load(self._conn.execute("SELECT chat_id, user_id FROM approved_users"))
+        for chat_id, domain, allowed in self._conn.execute("SELECT chat_id, domain, allowed FROM domain_lists"):
+            domain_lists.set(chat_id, domain, bool(allowed))
+        deletions = self._conn.execute("SELECT chat_id, message_id, due FROM deletions")
+        if shard_index is not None:
+            deletions = [row for row in deletions if shard_of(row[0]) == shard_index]
+        deletion_scheduler.restore(deletions)
+
+    @staticmethod
+    def _parse_settings(data: str) -> dict:
+        settings = json.loads(data)
+        # Saved before /spamwave: on unless every other filter was turned off
+        settings.setdefault("spamwave", any(settings.values()))
+        return settings
+
+    def refresh_shared(self):
+        # Shard workers: pick up global state written by other workers. Keys
+        # still dirty here are newer than the database and keep their value.
+        global maintenance_active
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        self._data_version = version
+        for table, members in (("whitelist", whitelist), ("approved_users", approved_users)):
+            stored = set(self._conn.execute(f"SELECT chat_id, user_id FROM {table}"))
+            dirty = self._dirty[table]
+            local = {key for key in dirty if members.contains(*key)}
+            members.load((stored - dirty) | local)
+        # Groups of the other workers, so /broadcast, /listgroups and
+        # /botstats see every group; this worker's own rows are authoritative
+        stored = {chat_id: data for chat_id, data in self._conn.execute("SELECT chat_id, data FROM settings")
+                  if shard_of(chat_id) != shard_index}
+        for chat_id in [chat_id for chat_id in self._shared_settings if chat_id not in stored]:
+            del self._shared_settings[chat_id]
+            group_settings.pop(chat_id, None)
+        for chat_id, data in stored.items():
+            if self._shared_settings.get(chat_id) != data:
+                self._shared_settings[chat_id] = data
+                group_settings[chat_id] = self._parse_settings(data)
+        maintenance_active = bool(self.get_kv("maintenance"))
+
+    def get_kv(self, key: str):
+        if key in self._kv:
+            return self._kv[key]
+        row = self._conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # Hot-path API: O(1), no I/O
+    def mark(self, table: str, key):
+        self._dirty[table].add(key)
+
+    def put_kv(self, key: str, value):
+        self._kv[key] = value
+
+    def _collect(self):
+        # Snapshot dirty rows on the event loop thread
+        dirty, self._dirty = self._dirty, {table: set() for table in self._dirty}
+        kv, self._kv = self._kv, {}
+        batch = {
+            "settings": [(chat_id, json.dumps(group_settings[chat_id]) if chat_id in group_settings else None)
+                         for chat_id in dirty["settings"]],
+            "warnings": [(key, warning_store.get_raw(key)) for key in dirty["warnings"]],
+            "whitelist": [(key, whitelist.contains(*key)) for key in dirty["whitelist"]],
+            "approved_users": [(key, approved_users.contains(*key)) for key in dirty["approved_users"]],
+            "domain_lists": [(key, domain_lists.get(*key)) for key in dirty["domain_lists"]],
+            "deletions": [(key, deletion_scheduler.pending.get(key)) for key in dirty["deletions"]],
+            "kv": [(key, None if value is None else json.dumps(value)) for key, value in kv.items()],
+        }
+        return batch
+
+    def _requeue(self, batch: dict):
+        # A batch that failed to write is dirty again; rows changed since are
+        # read afresh on the next flush
+        for table, keys in self._dirty.items():
+            keys.update(key for key, _ in batch[table])
+        for key, value in batch["kv"]:
+            self._kv.setdefault(key, None if value is None else json.loads(value))
+
+    def _write(self, batch: dict) -> int:
+        rows = 0
+        with self._conn:
+            for chat_id, data in batch["settings"]:
+                if data is None:
+                    self._conn.execute("DELETE FROM settings WHERE chat_id = ?", (chat_id,))
+                else:
+                    self._conn.execute("INSERT OR REPLACE INTO settings VALUES (?, ?)", (chat_id, data))
+            for (chat_id, user_id), entry in batch["warnings"]:
+                if entry is not None:
+                    self._conn.execute("INSERT OR REPLACE INTO warnings VALUES (?, ?, ?, ?)",
+                                       (chat_id, user_id, *entry))
+                else:
+                    self._conn.execute("DELETE FROM warnings WHERE chat_id = ? AND user_id = ?",
+                                       (chat_id, user_id))
+            for table in ("whitelist", "approved_users"):
+                for (chat_id, user_id), present in batch[table]:
+                    if present:
+                        self._conn.execute(f"INSERT OR IGNORE INTO {table} VALUES (?, ?)", (chat_id, user_id))
+                    else:
+                        self._conn.execute(f"DELETE FROM {table} WHERE chat_id = ? AND user_id = ?",
+                                           (chat_id, user_id))
+            for (chat_id, domain), allowed in batch["domain_lists"]:
+                if allowed is None:
+                    self._conn.execute("DELETE FROM domain_lists WHERE chat_id = ? AND domain = ?", (chat_id, domain))
+                else:
+                    self._conn.execute("INSERT OR REPLACE INTO domain_lists VALUES (?, ?, ?)",
+                                       (chat_id, domain, int(allowed)))
+            for (chat_id, message_id), due in batch["deletions"]:
+                if due is None:
+                    self._conn.execute("DELETE FROM deletions WHERE chat_id = ? AND message_id = ?",
+                                       (chat_id, message_id))
+                else:
+                    self._conn.execute("INSERT OR REPLACE INTO deletions VALUES (?, ?, ?)",
+                                       (chat_id, message_id, due))
+            for key, value in batch["kv"]:
+                if value is None:
+                    self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+                else:
+                    self._conn.execute("INSERT OR REPLACE INTO kv VALUES (?, ?)", (key, value))
+            for rows_in_table in batch.values():
+                rows += len(rows_in_table)
+        return rows
+
+    async def flush(self):
+        async with self._lock:
+            batch = self._collect()
+            if not any(batch.values()):
+                return
+            write = asyncio.ensure_future(asyncio.to_thread(self._write, batch))
+            try:
+                await asyncio.wait({write})
+            except asyncio.CancelledError:
+                # The thread runs on: hold the lock (and the connection) until it is done
+                await asyncio.wait({write})
+                raise
+            finally:
+                if write.done() and write.exception() is not None:
+                    self._requeue(batch)
+            self.rows_written += write.result()
+            self.flushes += 1
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(STATE_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+                if shard_index is not None:
+                    self.refresh_shared()
+            except Exception as e:
+                logger.error("State flush failed", extra={"error": str(e)})
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+state_store = StateStore(STATE_DB_PATH)
+
 # Owner check function
 def is_owner(user_id: int) -> bool:
     return user_id == BOT_OWNER_ID
 
+def is_exempt(chat_id: int, user_id: int) -> bool:
+    return whitelist.allows(chat_id, user_id) or approved_users.allows(chat_id, user_id)
+
 # --- Helper Functions ---
 def get_group_settings(chat_id: int):
     if chat_id not in group_settings:
-        group_settings[chat_id] = {"links": True, "biolinks": True, "username": True, "botlink": True}
+        group_settings[chat_id] = {"links": True, "biolinks": True, "username": True, "botlink": True, "spamwave": True}
+        state_store.mark("settings", chat_id)
     return group_settings[chat_id]
 
+# --- Detection Engine ---
+# All patterns are compiled once at import. DETECTION_RE scans a message in a
+# single pass: link tokens are matched directly, while "@" only consumes itself
+# and captures the following word in a lookahead, so a mention never hides a
+# link token that starts inside it (e.g. "@wa.me").
+LINK_TOKENS = (
+    r"https?://", r"t\.me/", r"wa\.me", r"instagram\.com", r"youtube\.com", r"facebook\.com",
+    r"twitter.com", r"whatsapp\.com", r"linkedin\.com", r"snapchat\.com", r"pinterest\.com",
+    r"reddit\.com", r"tiktok\.com", r"discord\.gg", r"telegram\.me",
+)
+LINK_PATTERN = "(" + "|".join(LINK_TOKENS) + ")"
+
+def _build_detection_pattern() -> str:
+    # Group link tokens by their (literal) first character and guard the whole
+    # alternation with a one-character lookahead, so positions that can't start
+    # a match are rejected without trying every alternative.
+    groups = {}
+    for token in LINK_TOKENS:
+        groups.setdefault(token[0], []).append(token[1:])
+    links = "|".join(f"{first}(?:{'|'.join(rests)})" for first, rests in groups.items())
+    first_chars = "".join(groups)
+    return rf"(?=[@{first_chars}])(?:(?P<links>{links})|@(?=(?P<mention>[\w_]+)))"
+
+LINK_RE = re.compile(LINK_PATTERN, re.IGNORECASE)
+BOT_USERNAME_RE = re.compile(r"@[\w_]*bot", re.IGNORECASE)
+USERNAME_RE = re.compile(r"@[\w_]+", re.IGNORECASE)
+DETECTION_RE = re.compile(_build_detection_pattern(), re.IGNORECASE)
+
+# Order in which filter_messages reports violations
+VIOLATION_ORDER = ("links", "botlink", "username")
+
+def scan_text(text: str) -> dict:
+    """Scan text once and return {violation_type: [(start, end), ...]}.
+
+    Every mention is reported as "username"; mentions containing "bot" are
+    reported as "botlink" as well, matching has_bot_username/has_username.
+    """
+    found = {}
+    if not text:
+        return found
+    for match in DETECTION_RE.finditer(text):
+        if match.lastgroup == "links":
+            found.setdefault("links", []).append(match.span())
+            continue
+        start = match.start()
+        end = match.end("mention")
+        found.setdefault("username", []).append((start, end))
+        if "bot" in match.group("mention").lower():
+            found.setdefault("botlink", []).append((start, end))
+    return found
+
+def _entity_text(text: str, entity: types.MessageEntity) -> str:
+    # Offsets are UTF-16 code units, which only match str indexes for ASCII
+    if text.isascii():
+        return text[entity.offset:entity.offset + entity.length]
+    return entity.extract_from(text)
+
+# Telegram parses no url or mention entities inside monospace text
+CODE_ENTITIES = ("code", "pre")
+
+def _utf16_len(text: str) -> int:
+    return len(text) if text.isascii() else len(text.encode("utf-16-le")) // 2
+
+def scan_entities(text: str, entities: List[types.MessageEntity]) -> dict:
+    """Classify a message from the entities Telegram parsed for it.
+
+    Returns the same shape as scan_text, with spans in UTF-16 code units.
+    url and text_link entities are links (a text_link hides its URL behind
+    ordinary words); mention and text_mention entities are usernames, and
+    botlinks as well when they name a bot. Emails and bot commands
+    ("/start@some_bot") are not violations. code and pre spans are scanned
+    with scan_text, as Telegram leaves them unparsed.
+    """
+    found = {}
+    for entity in entities:
+        kind = entity.type
+        if kind in CODE_ENTITIES:
+            code = _entity_text(text, entity)
+            for violation_type, spans in scan_text(code).items():
+                found.setdefault(violation_type, []).extend(
+                    (entity.offset + _utf16_len(code[:start]), entity.offset + _utf16_len(code[:end]))
+                    for start, end in spans
+                )
+        elif kind == "url" or kind == "text_link":
+            found.setdefault("links", []).append((entity.offset, entity.offset + entity.length))
+        elif kind == "mention" or kind == "text_mention":
+            span = (entity.offset, entity.offset + entity.length)
+            found.setdefault("username", []).append(span)
+            if kind == "text_mention":
+                names_bot = entity.user.is_bot
+            else:
+                names_bot = "bot" in _entity_text(text, entity).lower()
+            if names_bot:
+                found.setdefault("botlink", []).append(span)
+    return found
+
+def scan_message(message: types.Message) -> dict:
+    # Entities are free (Telegram already parsed them); scan only without them
+    text = message.text or message.caption or ""
+    entities = message.entities if message.text else message.caption_entities
+    if ENTITY_DETECTION and entities:
+        return scan_entities(text, entities)
+    return scan_text(text)
+
+def has_violations(text: str) -> bool:
+    # Any match at all is a violation; used where the type doesn't matter
+    return bool(text) and DETECTION_RE.search(text) is not None
+
 def has_links(text: str):
     if not text:
         return False
-    pattern = r"(https?://|t\.me/|wa\.me|instagram\.com|youtube\.com|facebook\.com|twitter.com|whatsapp\.com|linkedin\.com|snapchat\.com|pinterest\.com|reddit\.com|tiktok\.com|discord\.gg|telegram\.me)"
-    return bool(re.search(pattern, text, re.IGNORECASE))
+    return LINK_RE.search(text) is not None
 
 def has_bot_username(text: str):
     if not text:
         return False
-    pattern = r"@[\w_]*bot"
-    return bool(re.search(pattern, text, re.IGNORECASE))
+    return BOT_USERNAME_RE.search(text) is not None
 
 def has_username(text: str):
     if not text:
         return False
-    pattern = r"@[\w_]+"
-    return bool(re.search(pattern, text, re.IGNORECASE))
+    return USERNAME_RE.search(text) is not None
+
+# --- Domain Lists ---
+# Per-group allow and block lists share one map keyed by listed domain. A
+# lookup tries the host and each parent domain once ("mail.example.com",
+# "example.com", "com"), so it costs O(labels) however many domains are listed;
+# listing a domain covers its subdomains and the most specific listed suffix
+# wins.
+URL_HOST_RE = re.compile(r"(?:https?://)?(?:[^\s/@:]+@)?((?:[\w-]+\.)+[^\W\d_]{2,})", re.IGNORECASE)
 
-async def auto_delete(msg: types.Message, delay: int = 5):
+def normalize_host(url: str) -> Optional[str]:
+    """Lowercased, IDNA-encoded host of a URL or bare domain, or None."""
+    if "://" not in url:
+        url = "http://" + url
     try:
-        await asyncio.sleep(delay)
+        host = urlsplit(url.strip()).hostname
+    except ValueError:
+        return None
+    host = (host or "").rstrip(".")
+    if "." not in host:
+        return None
+    try:
+        return host.encode("idna").decode("ascii")
+    except UnicodeError:
+        return host
+
+def message_link_hosts(message: types.Message, links=()) -> list:
+    # Hosts of the links scan_message would see; None for one without a host.
+    # Without entities, `links` are scan_text's link spans
+    text = message.text or message.caption or ""
+    entities = message.entities if message.text else message.caption_entities
+    if ENTITY_DETECTION and entities:
+        hosts = []
+        for entity in entities:
+            if entity.type == "url":
+                hosts.append(normalize_host(_entity_text(text, entity)))
+            elif entity.type == "text_link":
+                hosts.append(normalize_host(entity.url))
+            elif entity.type in CODE_ENTITIES:
+                code = _entity_text(text, entity)
+                hosts.extend(_text_link_hosts(code, scan_text(code).get("links", ())))
+        return hosts
+    return _text_link_hosts(text, links)
+
+def _text_link_hosts(text: str, links) -> list:
+    # Hosts in plain text; a link span starting outside every host match (an
+    # IP address, localhost) adds a None. Only the start is tested: a token
+    # such as "t.me/" runs past its host
+    hosts, spans = [], []
+    for match in URL_HOST_RE.finditer(text):
+        hosts.append(normalize_host(match.group(1)))
+        spans.append(match.span())
+    for start, _ in links:
+        if not any(host_start <= start < host_end for host_start, host_end in spans):
+            hosts.append(None)
+    return hosts
+
+class DomainLists:
+    # Most domains are listed by one group, so a rule is packed into one int,
+    # chat_id << 1 | allowed; a domain several groups listed maps to a
+    # {chat_id: allowed} dict instead
+
+    def __init__(self):
+        self._rules = {}  # domain: packed rule or {chat_id: allowed}
+        self._counts = {}  # chat_id: domains listed
+
+    @staticmethod
+    def _lookup(rule, chat_id: int) -> Optional[bool]:
+        if type(rule) is int:
+            return bool(rule & 1) if rule >> 1 == chat_id else None
+        return rule.get(chat_id)
+
+    def covers(self, chat_id: int) -> bool:
+        return chat_id in self._counts
+
+    def count(self, chat_id: int) -> int:
+        return self._counts.get(chat_id, 0)
+
+    def get(self, chat_id: int, domain: str) -> Optional[bool]:
+        rule = self._rules.get(domain)
+        return None if rule is None else self._lookup(rule, chat_id)
+
+    def set(self, chat_id: int, domain: str, allowed: bool):
+        rule = self._rules.get(domain)
+        if rule is None or self._lookup(rule, chat_id) is None:
+            self._counts[chat_id] = self._counts.get(chat_id, 0) + 1
+        if rule is None or type(rule) is int and rule >> 1 == chat_id:
+            self._rules[domain] = chat_id << 1 | allowed
+        else:
+            if type(rule) is int:
+                rule = self._rules[domain] = {rule >> 1: bool(rule & 1)}
+            rule[chat_id] = allowed
+
+    def remove(self, chat_id: int, domain: str) -> bool:
+        rule = self._rules.get(domain)
+        if rule is None or self._lookup(rule, chat_id) is None:
+            return False
+        if type(rule) is int:
+            del self._rules[domain]
+        else:
+            del rule[chat_id]
+            if len(rule) == 1:
+                # Back to a single packed rule
+                (other, allowed), = rule.items()
+                self._rules[domain] = other << 1 | allowed
+        self._counts[chat_id] -= 1
+        if not self._counts[chat_id]:
+            del self._counts[chat_id]
+        return True
+
+    def verdict(self, chat_id: int, host: Optional[str]) -> Optional[bool]:
+        """True if allowed, False if blocked, None if the host isn't listed for the chat."""
+        if not host:
+            return None
+        rules = self._rules
+        index = 0
+        while True:
+            rule = rules.get(host[index:] if index else host)
+            if rule is not None:
+                verdict = self._lookup(rule, chat_id)
+                if verdict is not None:
+                    return verdict
+            index = host.find(".", index) + 1
+            if not index:
+                return None
+
+    def listed(self, chat_id: int) -> list:
+        """[(domain, allowed)] for one chat, sorted by domain."""
+        entries = []
+        for domain, rule in self._rules.items():
+            verdict = self._lookup(rule, chat_id)
+            if verdict is not None:
+                entries.append((domain, verdict))
+        return sorted(entries)
+
+    def __len__(self):
+        return sum(self._counts.values())
+
+domain_lists = DomainLists()
+
+# --- Deletion Scheduler ---
+class DeleteMessages(TelegramMethod[bool]):
+    # deleteMessages (Bot API 7.0) is not in this aiogram release yet
+    __returning__ = bool
+    __api_method__ = "deleteMessages"
+
+    chat_id: Union[int, str]
+    message_ids: List[int]
+
+DELETE_MESSAGES_LIMIT = 100  # ids per deleteMessages call
+
+def _ignore_delete_error(e: Exception) -> bool:
+    return "message to delete not found" in str(e).lower() or "message can't be deleted" in str(e).lower()
+
+class DeletionScheduler:
+    # One timer heap for every pending bot-message deletion. A single worker
+    # sleeps until the earliest deadline, collects everything due, groups it
+    # per chat and removes each group with deleteMessages, falling back to
+    # deleteMessage if the server refuses the bulk method. Deadlines are wall
+    # clock times and are persisted through the state store, so pending
+    # deletions survive a restart.
+    def __init__(self):
+        self.pending = {}  # (chat_id, message_id): due
+        self._heap = []  # (due, chat_id, message_id); stale entries skipped on pop
+        self._wakeup = asyncio.Event()
+        self.bulk_supported = True
+        self.deleted = 0
+
+    def schedule(self, chat_id: int, message_id: int, delay: float):
+        due = time.time() + delay
+        key = (chat_id, message_id)
+        self.pending[key] = due
+        heapq.heappush(self._heap, (due, chat_id, message_id))
+        state_store.mark("deletions", key)
+        if self._heap[0][0] == due:
+            self._wakeup.set()
+
+    def restore(self, rows):
+        for chat_id, message_id, due in rows:
+            self.pending[(chat_id, message_id)] = due
+            heapq.heappush(self._heap, (due, chat_id, message_id))
+
+    def _pop_due(self) -> dict:
+        due = {}
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            when, chat_id, message_id = heapq.heappop(self._heap)
+            key = (chat_id, message_id)
+            if self.pending.get(key) != when:
+                continue
+            del self.pending[key]
+            state_store.mark("deletions", key)
+            due.setdefault(chat_id, []).append(message_id)
+        return due
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            due = self._pop_due()
+            if due:
+                await asyncio.gather(*(self.delete(chat_id, ids) for chat_id, ids in due.items()))
+
+    async def delete(self, chat_id: int, message_ids: list):
+        if self.bulk_supported and len(message_ids) > 1:
+            for i in range(0, len(message_ids), DELETE_MESSAGES_LIMIT):
+                chunk = message_ids[i:i + DELETE_MESSAGES_LIMIT]
+                try:
+                    await bot(DeleteMessages(chat_id=chat_id, message_ids=chunk))
+                    self.deleted += len(chunk)
+                except TelegramNotFound:
+                    logger.warning("deleteMessages is not supported by the API server, deleting one by one")
+                    self.bulk_supported = False
+                    await self.delete(chat_id, message_ids[i:])
+                    return
+                except TelegramBadRequest as e:
+                    if not _ignore_delete_error(e):
+                        logger.warning("Bulk delete failed", extra={"chat_id": chat_id, "error": str(e)})
+                except Exception as e:
+                    logger.warning("Bulk delete failed", extra={"chat_id": chat_id, "error": str(e)})
+            return
+
+        for message_id in message_ids:
+            try:
+                await bot.delete_message(chat_id, message_id)
+                self.deleted += 1
+            except TelegramBadRequest as e:
+                if not _ignore_delete_error(e):
+                    logger.warning("Auto delete failed", extra={"chat_id": chat_id, "error": str(e)})
+            except Exception as e:
+                logger.warning("Error in auto delete", extra={"chat_id": chat_id, "error": str(e)})
+
+    def __len__(self):
+        return len(self.pending)
+
+deletion_scheduler = DeletionScheduler()
+
+def schedule_delete(msg: types.Message, delay: float = 5):
+    deletion_scheduler.schedule(msg.chat.id, msg.message_id, delay)
+
+# --- Bio Cache ---
+_MISSING = object()
+
+class TTLCache:
+    # Bounded LRU mapping where every entry also expires after a TTL
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key: (value, expires_at)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        if entry[1] <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return entry[0]
+
+    def set(self, key, value, ttl: float = None):
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        self._data.clear()
+
+    def snapshot(self) -> list:
+        # (key, value, seconds left), least recently used first
+        now = time.monotonic()
+        return [(key, value, expires_at - now) for key, (value, expires_at) in self._data.items() if expires_at > now]
+
+    def restore(self, entries: list, elapsed: float = 0):
+        # Entries from snapshot(), taken `elapsed` seconds ago
+        now = time.monotonic()
+        for key, value, left in entries:
+            if left > elapsed:
+                self._data[key] = (value, now + left - elapsed)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+def profile_key(user: types.User):
+    # Visible profile fields; a change means the bio may have changed too
+    return (user.username, user.first_name, user.last_name)
+
+class BioCache:
+    # Caches "bio has restricted content" per user. Concurrent lookups for the
+    # same user share one request, failed lookups are cached for a shorter TTL,
+    # and an entry is dropped once the user is seen with a different profile.
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float):
+        self._cache = TTLCache(maxsize, ttl)
+        self.negative_ttl = negative_ttl
+        self._inflight = {}  # user_id: Future
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def invalidate(self, user_id: int):
+        self._cache.pop(user_id)
+
+    def note_profile(self, user: types.User):
+        entry = self._cache.get(user.id)
+        if entry is not None and entry[1] != profile_key(user):
+            self._cache.pop(user.id)
+
+    async def get(self, user_id: int, fetch, profile=None) -> bool:
+        entry = self._cache.get(user_id)
+        if entry is not None and (profile is None or entry[1] == profile):
+            self.hits += 1
+            return entry[0]
+
+        pending = self._inflight.get(user_id)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        pending = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = pending
+        result = False
         try:
-            await msg.delete()
-        except TelegramBadRequest as e:
-            if "message to delete not found" not in str(e).lower():
-                print(f"Auto delete failed: {e}")
-    except asyncio.CancelledError:
-        print("Auto-delete task cancelled")
-    except Exception as e:
-        print(f"Error in auto_delete: {e}")
+            result = await fetch(user_id)
+            self._cache.set(user_id, (result, profile))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Bio check failed", extra={"user_id": user_id, "error": str(e)})
+            self._cache.set(user_id, (False, profile), ttl=self.negative_ttl)
+        finally:
+            del self._inflight[user_id]
+            pending.set_result(result)
+        return result
 
-# Bio checking function with real-time checking (no cache)
-async def check_user_bio(user_id: int):
-    try:
-        # Get fresh bio from Telegram with error handling
-        user = await bot.get_chat(user_id)
-        bio = user.bio or ""
-        
-        # Check for any restricted content in real-time
-        return has_links(bio) or has_username(bio) or has_bot_username(bio)
-        
-    except TelegramBadRequest as e:
-        print(f"Bio check failed for user {user_id}: {e}")
-        return False
-    except Exception as e:
-        print(f"Unexpected error in bio check: {e}")
-        return False
+    def peek(self, user_id: int, profile=None) -> Optional[bool]:
+        # Cached verdict only, without fetching
+        entry = self._cache.get(user_id)
+        if entry is None or (profile is not None and entry[1] != profile):
+            return None
+        return entry[0]
+
+    def snapshot(self) -> list:
+        return self._cache.snapshot()
+
+    def restore(self, entries: list, elapsed: float = 0):
+        self._cache.restore(entries, elapsed)
+
+    def __len__(self):
+        return len(self._cache)
+
+user_bio_cache = BioCache(BIO_CACHE_SIZE, BIO_CACHE_TTL, BIO_CACHE_NEGATIVE_TTL)
+
+async def _fetch_bio_violation(user_id: int) -> bool:
+    user = await bot.get_chat(user_id)
+    return has_violations(user.bio or "")
+
+# Bio checking function, served from user_bio_cache
+async def check_user_bio(user_id: int, profile=None):
+    return await user_bio_cache.get(user_id, _fetch_bio_violation, profile)
+
+# --- Spam Wave Detection ---
+# The same spam is often posted to many groups within seconds, with or
+# without links. Each tracked message is normalised and fingerprinted twice: a
+# hash of the normalised text for exact copies, and a 64-bit SimHash of its
+# words and word pairs for near-duplicates. SimHashes are indexed as six
+# 10-bit bands; only waves sharing a band with the new signature are compared,
+# which finds most copies within WAVE_MAX_DISTANCE bits (all within 5). Once a
+# text has been seen in WAVE_CHAT_THRESHOLD groups inside WAVE_WINDOW, it is a
+# wave: the copies already seen are deleted, later copies are removed without
+# further checks, and its senders are flagged in every group for
+# WAVE_FLAG_TTL. In sharded mode each worker sees only its own groups.
+ZERO_WIDTH = dict.fromkeys(map(ord, "\u200b\u200c\u200d\u2060\ufeff"))
+WAVE_DIGITS_RE = re.compile(r"\d")
+WAVE_SEPARATORS_RE = re.compile(r"[\W_]+")
+SIMHASH_MASK = (1 << 64) - 1
+WAVE_BANDS = 6
+WAVE_BAND_BITS = 10
+WAVE_MAX_REFS = 50  # earlier copies remembered per wave for deletion
+
+def normalize_text(text: str) -> str:
+    # Fold case, compatibility forms, digits, punctuation and invisible
+    # characters, the usual ways copies are varied
+    text = unicodedata.normalize("NFKC", text.translate(ZERO_WIDTH)).lower()
+    return WAVE_SEPARATORS_RE.sub(" ", WAVE_DIGITS_RE.sub("0", text)).strip()
+
+def simhash(normalized: str) -> int:
+    words = normalized.split()
+    features = words + [" ".join(pair) for pair in zip(words, words[1:])]
+    # Count set bits per column for all 64 columns at once: counters[i] holds
+    # bit i of every column's count (a ripple-carry add per feature)
+    counters = []
+    for feature in features:
+        carry = hash(feature) & SIMHASH_MASK
+        i = 0
+        while carry:
+            if i == len(counters):
+                counters.append(carry)
+                break
+            bits = counters[i]
+            counters[i] = bits ^ carry
+            carry &= bits
+            i += 1
+    # Keep the columns whose count exceeds half the features, comparing
+    # the sliced counts against the threshold from the top bit down
+    threshold = len(features) // 2
+    greater, equal = 0, SIMHASH_MASK
+    for i in reversed(range(len(counters))):
+        if threshold >> i & 1:
+            equal &= counters[i]
+        else:
+            greater |= equal & counters[i]
+            equal &= ~counters[i]
+    return greater
+
+class SpamWave:
+    __slots__ = ("signature", "keys", "chats", "senders", "refs", "last_seen", "active")
+
+    def __init__(self, signature: int):
+        self.signature = signature
+        self.keys = []  # exact-text hashes pointing at this wave
+        self.chats = set()
+        self.senders = set()
+        self.refs = []  # (chat_id, message_id, user_id) seen before the wave was confirmed
+        self.last_seen = 0.0
+        self.active = False
+
+class SpamWaveDetector:
+    def __init__(self, window: float, threshold: int, min_senders: int, min_chars: int, max_distance: int,
+                 flag_ttl: float, max_tracked: int):
+        self.window = window
+        self.threshold = threshold
+        self.min_senders = min_senders
+        self.min_chars = min_chars
+        self.max_distance = max_distance
+        self.max_tracked = max_tracked
+        self.flagged = TTLCache(100000, flag_ttl)  # user_id: True
+        self._exact = {}  # hash of normalised text: SpamWave
+        self._bands = [{} for _ in range(WAVE_BANDS)]  # band value: set of SpamWave
+        self._order = []  # heap of (last_seen when pushed, seq, SpamWave); one entry per wave
+        self._seq = itertools.count()
+        self.detected = 0
+
+    def is_flagged(self, user_id: int) -> bool:
+        return self.flagged.get(user_id) is not None
+
+    def observe(self, chat_id: int, message_id: int, user_id: int, text: str, now=None):
+        """Track one message; return its SpamWave if that is now a wave, else None."""
+        normalized = normalize_text(text)
+        if len(normalized) < self.min_chars:
+            return None
+        now = now or time.monotonic()
+        self._expire(now)
+
+        key = hash(normalized)
+        wave = self._exact.get(key)
+        if wave is None:
+            signature = simhash(normalized)
+            wave = self._nearest(signature)
+            if wave is None:
+                wave = SpamWave(signature)
+                heapq.heappush(self._order, (now, next(self._seq), wave))
+                for band, index in zip(self._band_values(signature), self._bands):
+                    index.setdefault(band, set()).add(wave)
+            if len(wave.keys) < WAVE_MAX_REFS:
+                wave.keys.append(key)
+                self._exact[key] = wave
+
+        wave.last_seen = now
+        wave.chats.add(chat_id)
+        wave.senders.add(user_id)
+        if wave.active:
+            self.flagged.set(user_id, True)
+            return wave
+        if len(wave.refs) < WAVE_MAX_REFS:
+            wave.refs.append((chat_id, message_id, user_id))
+        if len(wave.chats) < self.threshold or len(wave.senders) < self.min_senders:
+            return None
+        wave.active = True
+        self.detected += 1
+        for sender in wave.senders:
+            self.flagged.set(sender, True)
+        return wave
+
+    def _band_values(self, signature: int):
+        mask = (1 << WAVE_BAND_BITS) - 1
+        return [(signature >> (WAVE_BAND_BITS * band)) & mask for band in range(WAVE_BANDS)]
+
+    def _nearest(self, signature: int):
+        best, best_distance = None, self.max_distance + 1
+        for band, index in zip(self._band_values(signature), self._bands):
+            for wave in index.get(band, ()):
+                distance = bin(wave.signature ^ signature).count("1")
+                if distance < best_distance:
+                    best, best_distance = wave, distance
+        return best
+
+    def _expire(self, now: float):
+        # Heap entries keep the last_seen they were pushed with; a wave seen
+        # since then is pushed back with its current one instead of expiring
+        while self._order and (len(self._order) > self.max_tracked or self._order[0][0] + self.window < now):
+            pushed, _, wave = heapq.heappop(self._order)
+            if wave.last_seen != pushed and wave.last_seen + self.window >= now and \
+                    len(self._order) < self.max_tracked:
+                heapq.heappush(self._order, (wave.last_seen, next(self._seq), wave))
+                continue
+            for key in wave.keys:
+                if self._exact.get(key) is wave:
+                    del self._exact[key]
+            for band, index in zip(self._band_values(wave.signature), self._bands):
+                waves = index.get(band)
+                if waves is not None:
+                    waves.discard(wave)
+                    if not waves:
+                        del index[band]
+
+    def __len__(self):
+        return len(self._order)
+
+spam_waves = SpamWaveDetector(WAVE_WINDOW, WAVE_CHAT_THRESHOLD, WAVE_MIN_SENDERS, WAVE_MIN_CHARS, WAVE_MAX_DISTANCE,
+                              WAVE_FLAG_TTL, WAVE_MAX_TRACKED)
+
+# --- Outbound Request Scheduler ---
+# Every Bot API call goes through this session middleware. Calls wait in one
+# priority queue (delete > restrict/lookups > replies > logs > broadcasts).
+# Sends are released under a global token bucket (Telegram's ~30 messages/s)
+# plus a bucket per target chat; deletes, restricts and lookups are not rate
+# limited. Flood waits (retry_after) pause every call to the chat, or
+# everything for calls without a chat, and the call is retried. Warning replies are dropped when
+# they have gone stale: the user was muted meanwhile, or the reply has waited
+# longer than OUTBOUND_WARNING_MAX_AGE.
+class TokenBucket:
+    # Refills `rate` tokens per second up to `capacity`
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        # Seconds until a token is available
+        self._refill()
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def take(self):
+        self._tokens -= 1
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                wait = self.delay()
+                if not wait:
+                    self.take()
+                    return
+                await asyncio.sleep(wait)
+
+PRIORITY_DELETE, PRIORITY_RESTRICT, PRIORITY_REPLY, PRIORITY_LOG, PRIORITY_BROADCAST = range(5)
+
+OUTBOUND_PRIORITIES = {
+    "DeleteMessage": PRIORITY_DELETE,
+    "DeleteMessages": PRIORITY_DELETE,
+    "RestrictChatMember": PRIORITY_RESTRICT,
+    "BanChatMember": PRIORITY_RESTRICT,
+    "GetChat": PRIORITY_RESTRICT,
+    "GetChatMember": PRIORITY_RESTRICT,
+    "GetChatAdministrators": PRIORITY_RESTRICT,
+    "SendMessage": PRIORITY_REPLY,
+    "SendPhoto": PRIORITY_REPLY,
+    "EditMessageText": PRIORITY_REPLY,
+    "AnswerCallbackQuery": PRIORITY_REPLY,
+    "CopyMessage": PRIORITY_BROADCAST,
+}
+# Methods that post into a chat and count against the send limits
+SEND_METHODS = {"SendMessage", "SendPhoto", "CopyMessage"}
+
+# Set around a call to describe it to the scheduler, e.g. ("warning", chat_id, user_id)
+outbound_tag = contextvars.ContextVar("outbound_tag", default=None)
+
+class OutboundDropped(Exception):
+    # Raised to the caller when its request was dropped as stale
+    pass
+
+class OutboundScheduler(BaseRequestMiddleware):
+    def __init__(self, rate: float, chat_rate: float, chat_burst: float):
+        self.global_bucket = TokenBucket(rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._chat_buckets = TTLCache(100000, 300)
+        self._chat_pauses = TTLCache(100000, 300)  # chat_id: monotonic time its flood wait ends
+        self._paused_until = 0.0  # flood wait on a call without a chat
+        self._muted = TTLCache(100000, 3600)  # (chat_id, user_id): True while muted
+        self._queue = []  # (priority, seq, waiter)
+        self._seq = 0
+        self._wakeup = None
+        self._task = None
+        self.granted = 0
+        self.dropped = 0
+        self.flood_waits = 0
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets.set(chat_id, bucket)
+        return bucket
+
+    def _delay(self, waiter: dict, now: float) -> float:
+        # Seconds until the waiter may be released
+        chat_id = waiter["chat_id"]
+        wait = self._paused_until - now
+        if chat_id is not None:
+            wait = max(wait, self._chat_pauses.get(chat_id, 0.0) - now)
+        if waiter["sends"]:
+            wait = max(wait, self.global_bucket.delay())
+            if chat_id is not None:
+                wait = max(wait, self._chat_bucket(chat_id).delay())
+        return max(wait, 0.0)
+
+    def _pause(self, chat_id, seconds: float):
+        until = time.monotonic() + seconds
+        if chat_id is None:
+            self._paused_until = max(self._paused_until, until)
+        elif until > self._chat_pauses.get(chat_id, 0.0):
+            self._chat_pauses.set(chat_id, until, ttl=seconds)
+
+    def _is_stale(self, waiter: dict) -> bool:
+        tag = waiter["tag"]
+        if not tag or tag[0] != "warning":
+            return False
+        if self._muted.get((tag[1], tag[2])):
+            return True
+        return time.monotonic() - waiter["queued_at"] > OUTBOUND_WARNING_MAX_AGE
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._queue:
+                await self._wakeup.wait()
+                continue
+
+            # Highest priority waiter that is neither paused nor out of tokens
+            chosen = None
+            blocked = []
+            retry_in = None
+            now = time.monotonic()
+            while self._queue:
+                item = heapq.heappop(self._queue)
+                waiter = item[2]
+                if waiter["future"].done():
+                    continue
+                if self._is_stale(waiter):
+                    self.dropped += 1
+                    waiter["future"].set_exception(OutboundDropped())
+                    continue
+                wait = self._delay(waiter, now)
+                if wait:
+                    blocked.append(item)
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+                    continue
+                chosen = waiter
+                break
+            for item in blocked:
+                heapq.heappush(self._queue, item)
+
+            if chosen is None:
+                if retry_in is not None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), retry_in)
+                    except asyncio.TimeoutError:
+                        pass
+                continue
+
+            if chosen["sends"]:
+                self.global_bucket.take()
+                if chosen["chat_id"] is not None:
+                    self._chat_bucket(chosen["chat_id"]).take()
+            self.granted += 1
+            chosen["future"].set_result(None)
+
+    async def _acquire(self, priority: int, chat_id, sends: bool, tag):
+        self._ensure_running()
+        queued_at = time.monotonic()
+        waiter = {
+            "future": asyncio.get_running_loop().create_future(),
+            "chat_id": chat_id,
+            "sends": sends,
+            "tag": tag,
+            "queued_at": queued_at,
+        }
+        self._seq += 1
+        heapq.heappush(self._queue, (priority, self._seq, waiter))
+        self._wakeup.set()
+        try:
+            await waiter["future"]
+        finally:
+            OUTBOUND_WAIT_SECONDS.observe(time.monotonic() - queued_at, priority)
+
+    def _note_restriction(self, method):
+        key = (method.chat_id, method.user_id)
+        if method.permissions.can_send_messages is False:
+            ttl = max(1, (method.until_date or 0) - time.time()) if method.until_date else 3600
+            self._muted.set(key, True, ttl=ttl)
+        else:
+            self._muted.pop(key)
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        priority = OUTBOUND_PRIORITIES.get(name)
+        if priority is None:  # getUpdates, setWebhook, getMe, ...
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        if name == "SendMessage" and chat_id == LOG_CHAT_ID:
+            priority = PRIORITY_LOG
+        sends = name in SEND_METHODS
+        tag = outbound_tag.get()
+
+        for attempt in range(OUTBOUND_MAX_RETRIES + 1):
+            await self._acquire(priority, chat_id, sends, tag)
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.flood_waits += 1
+                self._pause(chat_id, e.retry_after)
+                if attempt == OUTBOUND_MAX_RETRIES:
+                    raise
+                logger.warning("Flood wait %ss, retrying", e.retry_after, extra={"method": name, "chat_id": chat_id})
+                continue
+            if name == "RestrictChatMember":
+                self._note_restriction(method)
+            return result
+
+    def __len__(self):
+        return len(self._queue)
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    # Registered after the scheduler, so it times only the request itself
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            API_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - start, name)
+
+outbound_scheduler = OutboundScheduler(OUTBOUND_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST)
+bot.session.middleware(outbound_scheduler)
+bot.session.middleware(ApiMetricsMiddleware())
+
+# --- Admin Roster ---
+ADMIN_STATUSES = (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.CREATOR)
+
+class AdminRoster:
+    # Per-chat set of admin user ids, loaded in bulk with getChatAdministrators
+    # and kept fresh from chat_member updates. A roster is reloaded after its
+    # TTL in case an update was missed; concurrent loads for a chat are shared.
+    def __init__(self, ttl: float, negative_ttl: float):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._rosters = {}  # chat_id: (admin_ids, expires_at)
+        self._inflight = {}  # chat_id: Future
+        self.loads = 0
+
+    async def is_admin(self, chat_id: int, user_id: int) -> bool:
+        roster = self._rosters.get(chat_id)
+        if roster is None or roster[1] <= time.monotonic():
+            admins = await self.load(chat_id)
+        else:
+            admins = roster[0]
+        return user_id in admins
+
+    async def load(self, chat_id: int) -> set:
+        pending = self._inflight.get(chat_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        pending = asyncio.get_running_loop().create_future()
+        self._inflight[chat_id] = pending
+        admins = set()
+        try:
+            self.loads += 1
+            members = await bot.get_chat_administrators(chat_id)
+            admins = {member.user.id for member in members}
+            self._rosters[chat_id] = (admins, time.monotonic() + self.ttl)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Admin roster load failed", extra={"chat_id": chat_id, "error": str(e)})
+            self._rosters[chat_id] = (admins, time.monotonic() + self.negative_ttl)
+        finally:
+            del self._inflight[chat_id]
+            pending.set_result(admins)
+        return admins
+
+    def update_member(self, chat_id: int, user_id: int, status):
+        roster = self._rosters.get(chat_id)
+        if roster is None:
+            return
+        if status in ADMIN_STATUSES:
+            roster[0].add(user_id)
+        else:
+            roster[0].discard(user_id)
+
+    def forget(self, chat_id: int):
+        self._rosters.pop(chat_id, None)
+
+    def snapshot(self) -> list:
+        # (chat_id, admin_ids, seconds left)
+        now = time.monotonic()
+        return [(chat_id, admins, expires_at - now)
+                for chat_id, (admins, expires_at) in self._rosters.items() if expires_at > now]
+
+    def restore(self, entries: list, elapsed: float = 0):
+        now = time.monotonic()
+        for chat_id, admins, left in entries:
+            if left > elapsed:
+                self._rosters[chat_id] = (admins, now + left - elapsed)
+
+    def __len__(self):
+        return len(self._rosters)
+
+admin_roster = AdminRoster(ADMIN_CACHE_TTL, ADMIN_CACHE_NEGATIVE_TTL)
 
 # --- Admin Check Function ---
 async def is_admin(chat_id: int, user_id: int) -> bool:
-    try:
-        member = await bot.get_chat_member(chat_id, user_id)
-        return member.status in [ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.CREATOR]
-    except TelegramBadRequest as e:
-        print(f"Admin check failed for user {user_id} in chat {chat_id}: {e}")
+    if chat_id > 0:  # private chats have no admins
         return False
+    return await admin_roster.is_admin(chat_id, user_id)
+
+# --- Member Directory ---
+# Users seen in group messages and member updates, so admin commands resolve
+# "@username" or a name locally: the Bot API has no call that lists a chat's
+# members. Usernames are indexed case-insensitively and full names are kept in
+# a sorted list for prefix search. Beyond MEMBER_DIRECTORY_SIZE the least
+# recently seen user is evicted.
+class MemberDirectory:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._users = OrderedDict()  # user_id: (profile_key, full_name, chat_ids)
+        self._by_username = {}  # lowercased username: user_id
+        self._names = []  # sorted (lowercased full name, user_id)
+
+    def observe(self, chat_id, user):
+        # user may also be a private Chat from getChat; chat_id None = no chat
+        entry = self._users.get(user.id)
+        profile = profile_key(user)
+        if entry is not None and entry[0] == profile:
+            self._users.move_to_end(user.id)
+            if chat_id is not None:
+                entry[2].add(chat_id)
+            return
+
+        chat_ids = set() if entry is None else entry[2]
+        if entry is not None:
+            self._unindex(user.id, entry)
+        if chat_id is not None:
+            chat_ids.add(chat_id)
+        full_name = user.full_name
+        self._users[user.id] = (profile, full_name, chat_ids)
+        self._users.move_to_end(user.id)
+        if user.username:
+            self._by_username[user.username.lower()] = user.id
+        bisect.insort(self._names, (full_name.lower(), user.id))
+        if len(self._users) > self.maxsize:
+            self._unindex(*self._users.popitem(last=False))
+
+    def leave(self, chat_id: int, user_id: int):
+        entry = self._users.get(user_id)
+        if entry is not None:
+            entry[2].discard(chat_id)
+
+    def _unindex(self, user_id: int, entry):
+        username = entry[0][0]
+        if username and self._by_username.get(username.lower()) == user_id:
+            del self._by_username[username.lower()]
+        key = (entry[1].lower(), user_id)
+        index = bisect.bisect_left(self._names, key)
+        if index < len(self._names) and self._names[index] == key:
+            del self._names[index]
+
+    def get(self, user_id: int):
+        # (username, full_name) or None
+        entry = self._users.get(user_id)
+        return None if entry is None else (entry[0][0], entry[1])
+
+    def find_username(self, username: str):
+        return self._by_username.get(username.lstrip("@").lower())
+
+    def find_name(self, prefix: str, chat_id=None, within=None):
+        # First user whose full name starts with prefix, optionally only
+        # members of chat_id and/or ids in within
+        prefix = prefix.lower()
+        for name, user_id in self._names[bisect.bisect_left(self._names, (prefix,)):]:
+            if not name.startswith(prefix):
+                break
+            if chat_id is not None and chat_id not in self._users[user_id][2]:
+                continue
+            if within is not None and user_id not in within:
+                continue
+            return user_id
+        return None
+
+    def snapshot(self) -> list:
+        # (user_id, entry), least recently seen first
+        return list(self._users.items())
+
+    def restore(self, entries: list):
+        # Restored users are older than anything seen since startup
+        for user_id, entry in reversed(entries):
+            if user_id in self._users or len(self._users) >= self.maxsize:
+                continue
+            self._users[user_id] = entry
+            self._users.move_to_end(user_id, last=False)
+            username = entry[0][0]
+            if username and username.lower() not in self._by_username:
+                self._by_username[username.lower()] = user_id
+            self._names.append((entry[1].lower(), user_id))
+        self._names.sort()
+
+    def __len__(self):
+        return len(self._users)
+
+member_directory = MemberDirectory(MEMBER_DIRECTORY_SIZE)
+
+# --- Moderation Log Sink ---
+# Moderation events are queued in memory and posted to LOG_CHAT_ID as digests
+# grouped by chat and event type, every LOG_DIGEST_INTERVAL seconds or as soon
+# as LOG_DIGEST_MAX_EVENTS are waiting. log() never awaits anything; when more
+# than LOG_DIGEST_MAX_GROUPS (chat, type) pairs are pending, further events are
+# only counted per type and summarised on one line.
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+class LogSink:
+    def __init__(self, interval: float, max_events: int, max_groups: int, sample_users: int):
+        self.interval = interval
+        self.max_events = max_events
+        self.max_groups = max_groups
+        self.sample_users = sample_users
+        self._groups = {}  # (chat_id, event_type): [chat_title, count, [user labels]]
+        self._overflow = {}  # event_type: count of events that didn't fit
+        self._queued = 0
+        self._flush_now = asyncio.Event()
+        self.sent = 0
+
+    def log(self, chat_id: int, chat_title: str, event_type: str, user: types.User):
+        self._queued += 1
+        if self._queued >= self.max_events:
+            self._flush_now.set()
+        key = (chat_id, event_type)
+        group = self._groups.get(key)
+        if group is None:
+            if len(self._groups) >= self.max_groups:
+                self._overflow[event_type] = self._overflow.get(event_type, 0) + 1
+                return
+            group = self._groups[key] = [chat_title, 0, []]
+        group[1] += 1
+        if len(group[2]) < self.sample_users:
+            label = f"@{user.username}" if user.username else user.first_name
+            if label not in group[2]:
+                group[2].append(label)
+
+    def _render(self, groups: dict, overflow: dict) -> list:
+        lines = ["🧾 Moderation digest"]
+        for (chat_id, event_type), (chat_title, count, users) in groups.items():
+            icon = "🔇" if event_type.endswith("mute") else "⚠️"
+            more = " …" if count > len(users) else ""
+            lines.append(f"{icon} {chat_title or chat_id}: {count}× {event_type} ({', '.join(users)}{more})")
+        if overflow:
+            summary = ", ".join(f"{event_type}: {count}" for event_type, count in overflow.items())
+            lines.append(f"➕ {sum(overflow.values())} more events in other chats ({summary})")
+
+        chunks, current = [], ""
+        for line in lines:
+            if len(current) + len(line) + 1 > TELEGRAM_MESSAGE_LIMIT:
+                chunks.append(current)
+                current = ""
+            current += line[:TELEGRAM_MESSAGE_LIMIT - 1] + "\n"
+        chunks.append(current)
+        return chunks
+
+    async def flush(self):
+        if not self._queued:
+            return
+        groups, self._groups = self._groups, {}
+        overflow, self._overflow = self._overflow, {}
+        self._queued = 0
+        for chunk in self._render(groups, overflow):
+            try:
+                await bot.send_message(LOG_CHAT_ID, chunk)
+                self.sent += 1
+            except Exception as e:
+                logger.warning("Log digest failed", extra={"error": str(e)})
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    def __len__(self):
+        return self._queued
+
+log_sink = LogSink(LOG_DIGEST_INTERVAL, LOG_DIGEST_MAX_EVENTS, LOG_DIGEST_MAX_GROUPS, LOG_DIGEST_SAMPLE_USERS)
+
+# --- Raid Mode ---
+# A raid floods a group with violations, each of which would otherwise cost
+# an admin check, a delete, a warning reply, a log event and maybe a mute.
+# Violations are counted per chat over a sliding RAID_WINDOW; at
+# RAID_THRESHOLD per second the chat switches to raid mode until
+# RAID_COOLDOWN passes without one. Meanwhile offending messages go to the
+# deletion scheduler (bulk deleteMessages every RAID_BATCH_INTERVAL), no
+# warnings or log events are sent, raiders reaching RAID_MUTE_STRIKES are
+# muted in batches, and one summary is posted when the raid ends.
+class Raid:
+    __slots__ = ("chat_id", "started", "last_violation", "deleted", "offenders", "to_mute", "muted")
+
+    def __init__(self, chat_id: int, now: float):
+        self.chat_id = chat_id
+        self.started = now
+        self.last_violation = now
+        self.deleted = 0
+        self.offenders = {}  # user_id: messages deleted
+        self.to_mute = []
+        self.muted = 0
+
+class RaidGuard:
+    def __init__(self, threshold: float, window: float, cooldown: float):
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self._recent = TTLCache(100000, window)  # chat_id: deque of violation times
+        self.raids = {}  # chat_id: Raid
+        self.tasks = set()
+        self.started = 0
+
+    def record(self, chat_id: int, now=None) -> Optional[Raid]:
+        """Count a violation; return the chat's Raid if it is in raid mode."""
+        now = now or time.monotonic()
+        raid = self.raids.get(chat_id)
+        if raid is not None:
+            raid.last_violation = now
+            return raid
+        times = self._recent.get(chat_id)
+        if times is None:
+            times = deque()
+        times.append(now)
+        while times[0] <= now - self.window:
+            times.popleft()
+        self._recent.set(chat_id, times)
+        if len(times) < self.threshold * self.window:
+            return None
+
+        self._recent.pop(chat_id)
+        raid = self.raids[chat_id] = Raid(chat_id, now)
+        self.started += 1
+        RAIDS.inc("started")
+        logger.warning("Raid mode on after %d violations", len(times), extra={"chat_id": chat_id})
+        task = asyncio.create_task(self._run(raid))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return raid
+
+    def add(self, raid: Raid, message: types.Message):
+        deletion_scheduler.schedule(message.chat.id, message.message_id, RAID_BATCH_INTERVAL)
+        raid.deleted += 1
+        user_id = message.from_user.id
+        strikes = raid.offenders[user_id] = raid.offenders.get(user_id, 0) + 1
+        if strikes == RAID_MUTE_STRIKES:
+            raid.to_mute.append(user_id)
+
+    async def _mute_pending(self, raid: Raid):
+        users, raid.to_mute = raid.to_mute, []
+        if not users:
+            return
+        until_date = int(time.time()) + mute_duration * 60
+        results = await asyncio.gather(*(
+            bot.restrict_chat_member(raid.chat_id, user_id, permissions=types.ChatPermissions(can_send_messages=False),
+                                     until_date=until_date)
+            for user_id in users
+        ), return_exceptions=True)
+        for user_id, result in zip(users, results):
+            if isinstance(result, Exception):
+                VIOLATIONS.inc("raid", "mute_failed")
+                logger.warning("Raid mute failed", extra={"chat_id": raid.chat_id, "user_id": user_id,
+                                                          "error": str(result)})
+                continue
+            raid.muted += 1
+            VIOLATIONS.inc("raid", "muted")
+            warning_store.reset(raid.chat_id, user_id)
+            state_store.mark("warnings", (raid.chat_id, user_id))
+
+    async def flush(self):
+        # Shutdown: mute the raiders still waiting for the next batch
+        await asyncio.gather(*(self._mute_pending(raid) for raid in list(self.raids.values())))
+
+    async def _run(self, raid: Raid):
+        try:
+            while time.monotonic() - raid.last_violation < self.cooldown:
+                await asyncio.sleep(RAID_BATCH_INTERVAL)
+                await self._mute_pending(raid)
+        finally:
+            del self.raids[raid.chat_id]
+        await self._mute_pending(raid)
+        RAIDS.inc("ended")
+
+        duration = int(raid.last_violation - raid.started)
+        logger.warning("Raid mode off after %ds: %d deleted from %d users, %d muted", duration, raid.deleted,
+                       len(raid.offenders), raid.muted, extra={"chat_id": raid.chat_id})
+        try:
+            await bot.send_message(
+                raid.chat_id,
+                f"🛡️ Raid over ({duration}s): removed {raid.deleted} messages from "
+                f"{len(raid.offenders)} users, muted {raid.muted} for {mute_duration} min."
+            )
+        except Exception as e:
+            logger.warning("Raid summary failed", extra={"chat_id": raid.chat_id, "error": str(e)})
+
+raid_guard = RaidGuard(RAID_THRESHOLD, RAID_WINDOW, RAID_COOLDOWN)
+
+# --- Notices ---
+# Warning, mute and admin notices are posted from their own task: replies
+# into one chat are paced by the outbound scheduler, and a chat's next update
+# must not wait for them (a flooded group would be handled at the reply rate).
+notice_tasks = set()
+
+async def _send_notice(send, tag):
+    token = outbound_tag.set(tag)
+    try:
+        schedule_delete(await send())
+    except OutboundDropped:
+        pass  # user was muted meanwhile, or the reply went stale
     except Exception as e:
-        print(f"Unexpected error in admin check: {e}")
-        return False
+        logger.warning("Notice failed", extra={"error": str(e)})
+    finally:
+        outbound_tag.reset(token)
+
+def post_notice(send, tag=None):
+    # send: coroutine function returning the Message to delete later
+    task = asyncio.create_task(_send_notice(send, tag))
+    notice_tasks.add(task)
+    task.add_done_callback(notice_tasks.discard)
 
 # --- NEW FUNCTION: Admin message deletion without warning ---
 async def delete_admin_message(message: types.Message):
     try:
         await message.delete()
     except TelegramBadRequest as e:
-        print(f"Delete failed: {e}")
+        logger.warning("Delete failed", extra=message_fields(message, error=str(e)))
         return
 
     # Send polite deletion notice for admins
-    deletion_msg = await message.answer(
+    post_notice(lambda: message.answer(
         f"🗑️ Admin @{message.from_user.username or message.from_user.first_name}, your link was deleted. Please approve yourself first using /approveme",
         reply_markup=InlineKeyboardMarkup(
             inline_keyboard=[
@@ -127,30 +2103,45 @@ async def delete_admin_message(message: types.Message):
                 [InlineKeyboardButton(text="📢 Updates", url=f"https://t.me/{UPDATES_USERNAME}")]
             ]
         )
-    )
-    asyncio.create_task(auto_delete(deletion_msg))
+    ))
 
 # --- UPDATED: Custom Warning Function with Specific Messages ---
-async def warn_and_delete(message: types.Message, violation_type: str = "links"):
+async def warn_and_delete(message: types.Message, violation_type: str = "links", quiet: bool = False):
+    # quiet: delete and count the strike, but post no warning or mute notice
+    # and log no digest event
     try:
         # Check if user is admin first
-        is_user_admin = await is_admin(message.chat.id, message.from_user.id)
+        with STAGE_SECONDS.time("admin_check"):
+            is_user_admin = await is_admin(message.chat.id, message.from_user.id)
         
         if is_user_admin:
+            VIOLATIONS.inc(violation_type, "admin")
             await delete_admin_message(message)
             return
             
-        if message.from_user.id in whitelist or message.from_user.id in approved_users:
+        if is_exempt(message.chat.id, message.from_user.id):
+            VIOLATIONS.inc(violation_type, "exempt")
+            return
+
+        # In a raid the message only joins the next bulk delete
+        raid = raid_guard.record(message.chat.id) if RAID_MODE else None
+        if raid is not None:
+            raid_guard.add(raid, message)
+            VIOLATIONS.inc(violation_type, "raid_deleted")
             return
 
         user_id = message.from_user.id
-        warnings[user_id] = warnings.get(user_id, 0) + 1
+        strikes = warning_store.add(message.chat.id, user_id)
+        state_store.mark("warnings", (message.chat.id, user_id))
 
         try:
-            await message.delete()
+            with STAGE_SECONDS.time("delete"):
+                await message.delete()
         except TelegramBadRequest as e:
-            print(f"Delete failed: {e}")
+            VIOLATIONS.inc(violation_type, "delete_failed")
+            logger.warning("Delete failed", extra=message_fields(message, violation=violation_type, error=str(e)))
             return  # Don't proceed if message deletion failed
+        VIOLATIONS.inc(violation_type, "deleted")
 
         # Custom warning messages based on violation type
         if violation_type == "biolinks":
@@ -162,31 +2153,27 @@ async def warn_and_delete(message: types.Message, violation_type: str = "links")
         elif violation_type == "botlink":
             warning_text = f"👤 @{message.from_user.username or message.from_user.first_name} Your message was hidden. Bot usernames are not allowed in this group, please remove them."
         else:
-            warning_text = f"⚠️ @{message.from_user.username or message.from_user.first_name} Warning {warnings[user_id]}/3 - Risky content not allowed!"
-
-        # REMOVED HELP BUTTON FROM WARNING MESSAGE
-        warning_msg = await message.answer(
-            warning_text,
-            reply_markup=InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(text="👑 Owner", url=f"https://t.me/{OWNER_USERNAME}")],
-                    [InlineKeyboardButton(text="📢 Updates", url=f"https://t.me/{UPDATES_USERNAME}")]
-                ]
-            )
-        )
-
-        asyncio.create_task(auto_delete(warning_msg))
-
-        # Log the action with error handling
-        try:
-            await bot.send_message(
-                LOG_CHAT_ID,
-                f"⚠️ @{message.from_user.username or message.from_user.first_name} sent {violation_type} in {message.chat.title}"
-            )
-        except TelegramBadRequest as e:
-            print(f"Log failed: {e}")
+            warning_text = f"⚠️ @{message.from_user.username or message.from_user.first_name} Warning {strikes}/{WARNING_LIMIT} - Risky content not allowed!"
 
-        if warnings[user_id] >= 3:
+        # At the mute threshold the mute notice replaces the warning reply
+        muting = strikes >= WARNING_LIMIT
+        if not muting and not quiet:
+            # REMOVED HELP BUTTON FROM WARNING MESSAGE
+            post_notice(lambda: message.answer(
+                warning_text,
+                reply_markup=InlineKeyboardMarkup(
+                    inline_keyboard=[
+                        [InlineKeyboardButton(text="👑 Owner", url=f"https://t.me/{OWNER_USERNAME}")],
+                        [InlineKeyboardButton(text="📢 Updates", url=f"https://t.me/{UPDATES_USERNAME}")]
+                    ]
+                )
+            ), ("warning", message.chat.id, user_id))
+
+        # Queue the action for the next log digest (quiet copies are logged once by their caller)
+        if not quiet:
+            log_sink.log(message.chat.id, message.chat.title, violation_type, message.from_user)
+
+        if muting:
             until_date = int(time.time()) + mute_duration * 60
             try:
                 await bot.restrict_chat_member(
@@ -196,36 +2183,33 @@ async def warn_and_delete(message: types.Message, violation_type: str = "links")
                     until_date=until_date
                 )
 
-                mute_msg = await bot.send_message(
-                    message.chat.id,
-                    f"🔇 @{message.from_user.username or message.from_user.first_name} muted for {mute_duration} min.",
-                    reply_markup=InlineKeyboardMarkup(
-                        inline_keyboard=[
-                            [InlineKeyboardButton(text="Unmute", callback_data=f"unmute:{user_id}")]
-                        ]
-                    )
-                )
-                asyncio.create_task(auto_delete(mute_msg))
+                if not quiet:
+                    post_notice(lambda: bot.send_message(
+                        message.chat.id,
+                        f"🔇 @{message.from_user.username or message.from_user.first_name} muted for {mute_duration} min.",
+                        reply_markup=InlineKeyboardMarkup(
+                            inline_keyboard=[
+                                [InlineKeyboardButton(text="Unmute", callback_data=f"unmute:{user_id}")]
+                            ]
+                        )
+                    ))
+
+                VIOLATIONS.inc(violation_type, "muted")
 
                 # reset warnings after mute
-                warnings[user_id] = 0
+                warning_store.reset(message.chat.id, user_id)
+                state_store.mark("warnings", (message.chat.id, user_id))
 
-                # Log the mute action
-                try:
-                    await bot.send_message(
-                        LOG_CHAT_ID,
-                        f"🔇 @{message.from_user.username or message.from_user.first_name} muted in {message.chat.title}"
-                    )
-                except TelegramBadRequest as e:
-                    print(f"Log failed: {e}")
+                # Queue the mute action for the next log digest
+                log_sink.log(message.chat.id, message.chat.title, "mute", message.from_user)
 
             except TelegramBadRequest as e:
-                error_msg = await message.reply("❌ I need admin permissions to mute users!")
-                asyncio.create_task(auto_delete(error_msg))
-                print(f"Mute failed: {e}")
+                VIOLATIONS.inc(violation_type, "mute_failed")
+                post_notice(lambda: message.reply("❌ I need admin permissions to mute users!"))
+                logger.warning("Mute failed", extra=message_fields(message, error=str(e)))
                 
     except Exception as e:
-        print(f"Error in warn_and_delete: {e}")
+        logger.exception("Error in warn_and_delete", extra=message_fields(message))
 
 # --- Updated PM Buttons Function ---
 async def get_personal_buttons():
@@ -281,7 +2265,7 @@ async def cmd_start(message: types.Message):
             )
         except Exception as e:
             # If photo fails, send simple message
-            print(f"Photo send failed: {e}")
+            logger.warning("Photo send failed", extra={"chat_id": message.chat.id, "error": str(e)})
             await message.reply(
                 f"Hey 👋🏻 {user_name}\n\n"
                 "Welcome to Links Shield Bot\n"
@@ -312,6 +2296,11 @@ ADMIN_HELP_TEXT = """🔧 *Admin Commands:*
 • `/username on|off` - Toggle username detection  
 • `/biolinks on|off` - Toggle bio link detection
 • `/botlink on|off` - Toggle bot username detection
+• `/spamwave on|off` - Toggle removal of spam copied across groups
+• `/allowdomain <domain>` - Allow links to a domain and its subdomains
+• `/blockdomain <domain>` - Always delete links to a domain
+• `/unlistdomain <domain>` - Remove a domain from the lists
+• `/domains` - Show allowed and blocked domains
 • `/whitelistadd` - Reply to user to whitelist them
 • `/whitelistremove` - Reply to remove from whitelist
 • `/whitelistshow` - Show whitelisted users
@@ -354,8 +2343,7 @@ async def cmd_help(message: types.Message):
     # Group chat
     else:
         try:
-            member = await bot.get_chat_member(message.chat.id, message.from_user.id)
-            if member.status in [ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.CREATOR]:
+            if await is_admin(message.chat.id, message.from_user.id):
                 if is_owner(message.from_user.id):
                     # Show everything to owner in group
                     help_text = f"{BASIC_HELP_TEXT}\n\n{ADMIN_HELP_TEXT}\n\n{OWNER_HELP_TEXT}"
@@ -364,16 +2352,13 @@ async def cmd_help(message: types.Message):
                     help_text = f"{BASIC_HELP_TEXT}\n\n{ADMIN_HELP_TEXT}"
                 
                 help_msg = await message.reply(help_text, parse_mode="Markdown")
-                await asyncio.sleep(10)
-                await help_msg.delete()
+                schedule_delete(help_msg, 10)
             else:
                 status_msg = await message.reply("❌ Only admins can use this command!")
-                await asyncio.sleep(5)
-                await status_msg.delete()
+                schedule_delete(status_msg, 5)
         except:
             status_msg = await message.reply("❌ Only admins can use this command!")
-            await asyncio.sleep(5)
-            await status_msg.delete()
+            schedule_delete(status_msg, 5)
 
 # --- Approveme Command ---
 @dp.message(Command("approveme"))
@@ -383,17 +2368,18 @@ async def approve_me(message: types.Message):
         
     if not await is_admin(message.chat.id, message.from_user.id):
         status_msg = await message.reply("❌ Only admins can use this command!")
-        asyncio.create_task(auto_delete(status_msg, 10))
+        schedule_delete(status_msg, 10)
         return
     
     user_id = message.from_user.id
-    approved_users.add(user_id)
+    approved_users.add(message.chat.id, user_id)
+    state_store.mark("approved_users", (message.chat.id, user_id))
     
     status_msg = await message.reply(
         f"✅ @{message.from_user.username or message.from_user.first_name} approved!\n"
         f"You can now send links in this group."
     )
-    asyncio.create_task(auto_delete(status_msg, 10))
+    schedule_delete(status_msg, 10)
 
 # --- Toggle Commands (Fixed for admins only) ---
 @dp.message(Command("biolinks"))
@@ -403,20 +2389,21 @@ async def toggle_biolinks(message: types.Message):
         
     if not await is_admin(message.chat.id, message.from_user.id):
         status_msg = await message.reply("❌ Only admins can use this command!")
-        asyncio.create_task(auto_delete(status_msg, 10))
+        schedule_delete(status_msg, 10)
         return
         
     args = message.text.split()
     if len(args) != 2 or args[1].lower() not in ["on", "off"]:
         status_msg = await message.reply("Usage: /biolinks on|off")
-        asyncio.create_task(auto_delete(status_msg, 10))
+        schedule_delete(status_msg, 10)
         return
         
     settings = get_group_settings(message.chat.id)
     settings["biolinks"] = args[1].lower() == "on"
+    state_store.mark("settings", message.chat.id)
     
     status_msg = await message.reply(f"Bio links deletion set to {'ON ✅' if settings['biolinks'] else 'OFF ❌'}")
-    asyncio.create_task(auto_delete(status_msg, 10))
+    schedule_delete(status_msg, 10)
 
 @dp.message(Command("links"))
 async def toggle_links(message: types.Message):
@@ -425,20 +2412,21 @@ async def toggle_links(message: types.Message):
         
     if not await is_admin(message.chat.id, message.from_user.id):
         status_msg = await message.reply("❌ Only admins can use this command!")
-        asyncio.create_task(auto_delete(status_msg, 10))
+        schedule_delete(status_msg, 10)
         return
         
     args = message.text.split()
     if len(args) != 2 or args[1].lower() not in ["on", "off"]:
         status_msg = await message.reply("Usage: /links on|off")
-        asyncio.create_task(auto_delete(status_msg, 10))
+        schedule_delete(status_msg, 10)
         return
         
     settings = get_group_settings(message.chat.id)
     settings["links"] = args[1].lower() == "on"
+    state_store.mark("settings", message.chat.id)
     
     status_msg = await message.reply(f"Links deletion set to {'ON ✅' if settings['links'] else 'OFF ❌'}")
-    asyncio.create_task(auto_delete(status_msg, 10))
+    schedule_delete(status_msg, 10)
 
 @dp.message(Command("username"))
 async def toggle_username(message: types.Message):
@@ -447,20 +2435,21 @@ async def toggle_username(message: types.Message):
         
     if not await is_admin(message.chat.id, message.from_user.id):
         status_msg = await message.reply("❌ Only admins can use this command!")
-        asyncio.create_task(auto_delete(status_msg, 10))
+        schedule_delete(status_msg, 10)
         return
         
     args = message.text.split()
     if len(args) != 2 or args[1].lower() not in ["on", "off"]:
         status_msg = await message.reply("Usage: /username on|off")
-        asyncio.create_task(auto_delete(status_msg, 10))
+        schedule_delete(status_msg, 10)
         return
         
     settings = get_group_settings(message.chat.id)
     settings["username"] = args[1].lower() == "on"
+    state_store.mark("settings", message.chat.id)
     
     status_msg = await message.reply(f"Username deletion set to {'ON ✅' if settings['username'] else 'OFF ❌'}")
-    asyncio.create_task(auto_delete(status_msg, 10))
+    schedule_delete(status_msg, 10)
 
 @dp.message(Command("botlink"))
 async def toggle_botlink(message: types.Message):
@@ -469,27 +2458,137 @@ async def toggle_botlink(message: types.Message):
         
     if not await is_admin(message.chat.id, message.from_user.id):
         status_msg = await message.reply("❌ Only admins can use this command!")
-        asyncio.create_task(auto_delete(status_msg, 10))
+        schedule_delete(status_msg, 10)
         return
         
     args = message.text.split()
     if len(args) != 2 or args[1].lower() not in ["on", "off"]:
         status_msg = await message.reply("Usage: /botlink on|off")
-        asyncio.create_task(auto_delete(status_msg, 10))
+        schedule_delete(status_msg, 10)
         return
         
     settings = get_group_settings(message.chat.id)
     settings["botlink"] = args[1].lower() == "on"
+    state_store.mark("settings", message.chat.id)
     
     status_msg = await message.reply(f"Bot usernames deletion set to {'ON ✅' if settings['botlink'] else 'OFF ❌'}")
-    asyncio.create_task(auto_delete(status_msg, 10))
+    schedule_delete(status_msg, 10)
+
+@dp.message(Command("spamwave"))
+async def toggle_spamwave(message: types.Message):
+    if message.chat.type == "private": 
+        return
+        
+    if not await is_admin(message.chat.id, message.from_user.id):
+        status_msg = await message.reply("❌ Only admins can use this command!")
+        schedule_delete(status_msg, 10)
+        return
+        
+    args = message.text.split()
+    if len(args) != 2 or args[1].lower() not in ["on", "off"]:
+        status_msg = await message.reply("Usage: /spamwave on|off")
+        schedule_delete(status_msg, 10)
+        return
+        
+    settings = get_group_settings(message.chat.id)
+    settings["spamwave"] = args[1].lower() == "on"
+    state_store.mark("settings", message.chat.id)
+    
+    status_msg = await message.reply(f"Spam wave deletion set to {'ON ✅' if settings['spamwave'] else 'OFF ❌'}")
+    schedule_delete(status_msg, 10)
+
+# --- Domain List Commands ---
+async def _domain_command_arg(message: types.Message, usage: str) -> Optional[str]:
+    # Shared checks for /allowdomain, /blockdomain and /unlistdomain
+    if message.chat.type == "private":
+        return None
+
+    if not await is_admin(message.chat.id, message.from_user.id):
+        status_msg = await message.reply("❌ Only admins can use this command!")
+        schedule_delete(status_msg, 10)
+        return None
+
+    args = message.text.split()
+    domain = normalize_host(args[1]) if len(args) == 2 else None
+    if domain is None:
+        status_msg = await message.reply(f"Usage: {usage} example.com")
+        schedule_delete(status_msg, 10)
+    return domain
+
+async def _list_domain(message: types.Message, allowed: bool):
+    domain = await _domain_command_arg(message, "/allowdomain" if allowed else "/blockdomain")
+    if domain is None:
+        return
+
+    chat_id = message.chat.id
+    if domain_lists.get(chat_id, domain) is None and domain_lists.count(chat_id) >= DOMAIN_LIST_LIMIT:
+        status_msg = await message.reply(f"❌ This group already lists {DOMAIN_LIST_LIMIT} domains. Use /unlistdomain first.")
+        schedule_delete(status_msg, 10)
+        return
+
+    domain_lists.set(chat_id, domain, allowed)
+    state_store.mark("domain_lists", (chat_id, domain))
+    if allowed:
+        status_msg = await message.reply(f"✅ Links to {domain} (and its subdomains) are allowed in this group.")
+    else:
+        status_msg = await message.reply(f"🚫 Links to {domain} (and its subdomains) will always be deleted.")
+    schedule_delete(status_msg, 10)
+
+@dp.message(Command("allowdomain"))
+async def allow_domain(message: types.Message):
+    await _list_domain(message, True)
+
+@dp.message(Command("blockdomain"))
+async def block_domain(message: types.Message):
+    await _list_domain(message, False)
+
+@dp.message(Command("unlistdomain"))
+async def unlist_domain(message: types.Message):
+    domain = await _domain_command_arg(message, "/unlistdomain")
+    if domain is None:
+        return
+
+    if domain_lists.remove(message.chat.id, domain):
+        state_store.mark("domain_lists", (message.chat.id, domain))
+        status_msg = await message.reply(f"✅ {domain} removed from this group's domain lists.")
+    else:
+        status_msg = await message.reply(f"{domain} is not listed in this group.")
+    schedule_delete(status_msg, 10)
+
+@dp.message(Command("domains"))
+async def show_domains(message: types.Message):
+    if message.chat.type == "private":
+        return
+
+    if not await is_admin(message.chat.id, message.from_user.id):
+        status_msg = await message.reply("❌ Only admins can use this command!")
+        schedule_delete(status_msg, 10)
+        return
+
+    entries = domain_lists.listed(message.chat.id)
+    if not entries:
+        status_msg = await message.reply("No allowed or blocked domains.")
+        schedule_delete(status_msg, 10)
+        return
+
+    allowed = [domain for domain, is_allowed in entries if is_allowed]
+    blocked = [domain for domain, is_allowed in entries if not is_allowed]
+    lines = []
+    for title, domains in (("✅ Allowed", allowed), ("🚫 Blocked", blocked)):
+        if domains:
+            lines.append(f"{title} ({len(domains)}):")
+            lines.extend(f"• {domain}" for domain in domains[:50])
+            if len(domains) > 50:
+                lines.append(f"… and {len(domains) - 50} more")
+    status_msg = await message.reply("\n".join(lines))
+    schedule_delete(status_msg, 30)
 
 # --- COMPLETELY FIXED: Whitelist Commands ---
 @dp.message(Command("whitelistadd"))
 async def whitelist_add(message: types.Message):
     if not await is_admin(message.chat.id, message.from_user.id):
         status_msg = await message.reply("❌ Only admins can use this command!")
-        asyncio.create_task(auto_delete(status_msg, 10))
+        schedule_delete(status_msg, 10)
         return
     
     user_id = None
@@ -506,15 +2605,10 @@ async def whitelist_add(message: types.Message):
             if entity.type == "mention":
                 # Extract username from mention
                 username = message.text[entity.offset+1:entity.offset+entity.length]
-                try:
-                    # Search for user by username in current chat
-                    async for member in bot.get_chat_members(message.chat.id):
-                        if member.user.username and member.user.username.lower() == username.lower():
-                            user_id = member.user.id
-                            user_name = member.user.full_name
-                            break
-                except Exception as e:
-                    continue
+                user_id = member_directory.find_username(username)
+                if user_id:
+                    user_name = member_directory.get(user_id)[1]
+                    break
             elif entity.type == "text_mention":
                 # Direct user mention
                 user_id = entity.user.id
@@ -525,40 +2619,31 @@ async def whitelist_add(message: types.Message):
     elif len(message.text.split()) > 1:
         username_arg = message.text.split()[1].replace('@', '').strip()
         if username_arg:
-            try:
-                # Try to search user in the current chat
-                async for member in bot.get_chat_members(message.chat.id):
-                    if (member.user.username and member.user.username.lower() == username_arg.lower()) or \
-                       (member.user.full_name and username_arg.lower() in member.user.full_name.lower()):
-                        user_id = member.user.id
-                        user_name = member.user.full_name
-                        break
-                
-                if not user_id:
-                    status_msg = await message.reply(f"❌ User @{username_arg} not found in this group!")
-                    asyncio.create_task(auto_delete(status_msg, 10))
-                    return
-                    
-            except Exception as e:
-                status_msg = await message.reply(f"❌ Error finding user!")
-                asyncio.create_task(auto_delete(status_msg, 10))
+            # Username anywhere, or a name prefix among this group's members
+            user_id = member_directory.find_username(username_arg) or \
+                member_directory.find_name(username_arg, chat_id=message.chat.id)
+            if not user_id:
+                status_msg = await message.reply(f"❌ User @{username_arg} not found in this group!")
+                schedule_delete(status_msg, 10)
                 return
+            user_name = member_directory.get(user_id)[1]
     
     else:
         status_msg = await message.reply("❌ Usage:\n• Reply to user's message\n• Or use: /whitelistadd @username\n• Or mention the user")
-        asyncio.create_task(auto_delete(status_msg, 10))
+        schedule_delete(status_msg, 10)
         return
     
     if user_id:
-        whitelist.add(user_id)
+        whitelist.add(message.chat.id, user_id)
+        state_store.mark("whitelist", (message.chat.id, user_id))
         status_msg = await message.reply(f"✅ {user_name} (ID: {user_id}) whitelisted successfully!")
-        asyncio.create_task(auto_delete(status_msg, 10))
+        schedule_delete(status_msg, 10)
 
 @dp.message(Command("whitelistremove"))
 async def whitelist_remove(message: types.Message):
     if not await is_admin(message.chat.id, message.from_user.id):
         status_msg = await message.reply("❌ Only admins can use this command!")
-        asyncio.create_task(auto_delete(status_msg, 10))
+        schedule_delete(status_msg, 10)
         return
     
     user_id = None
@@ -575,16 +2660,10 @@ async def whitelist_remove(message: types.Message):
             if entity.type == "mention":
                 # Extract username from mention
                 username = message.text[entity.offset+1:entity.offset+entity.length]
-                # Search in whitelist by username
-                for uid in list(whitelist):
-                    try:
-                        user = await bot.get_chat(uid)
-                        if user.username and user.username.lower() == username.lower():
-                            user_id = uid
-                            user_name = user.full_name
-                            break
-                    except:
-                        continue
+                user_id = await find_whitelisted(username, message.chat.id)
+                if user_id:
+                    user_name = member_directory.get(user_id)[1]
+                    break
             elif entity.type == "text_mention":
                 # Direct user mention
                 user_id = entity.user.id
@@ -595,58 +2674,92 @@ async def whitelist_remove(message: types.Message):
     elif len(message.text.split()) > 1:
         username_arg = message.text.split()[1].replace('@', '').strip()
         if username_arg:
-            # Search in whitelist by username or user ID
-            for uid in list(whitelist):
-                try:
-                    user = await bot.get_chat(uid)
-                    if (user.username and user.username.lower() == username_arg.lower()) or \
-                       (user.full_name and username_arg.lower() in user.full_name.lower()) or \
-                       str(uid) == username_arg:
-                        user_id = uid
-                        user_name = user.full_name
-                        break
-                except:
-                    continue
+            # Search in whitelist by username, name prefix or user ID
+            user_id = await find_whitelisted(username_arg, message.chat.id)
+            if user_id:
+                known = member_directory.get(user_id)
+                user_name = known[1] if known else str(user_id)
             
             if not user_id:
                 status_msg = await message.reply(f"❌ User @{username_arg} not found in whitelist!")
-                asyncio.create_task(auto_delete(status_msg, 10))
+                schedule_delete(status_msg, 10)
                 return
     
     else:
         status_msg = await message.reply("❌ Usage:\n• Reply to user's message\n• Or use: /whitelistremove @username\n• Or mention the user")
-        asyncio.create_task(auto_delete(status_msg, 10))
+        schedule_delete(status_msg, 10)
         return
     
     if user_id:
-        whitelist.discard(user_id)
-        approved_users.discard(user_id)  # Also remove from approved
-        status_msg = await message.reply(f"❌ {user_name} (ID: {user_id}) removed from whitelist!")
-        asyncio.create_task(auto_delete(status_msg, 10))
+        # This group's entries; global ones apply in every group, so only the
+        # owner removes those
+        scopes = (message.chat.id, GLOBAL_SCOPE) if is_owner(message.from_user.id) else (message.chat.id,)
+        for scope in scopes:
+            whitelist.discard(scope, user_id)
+            approved_users.discard(scope, user_id)  # Also remove from approved
+            state_store.mark("whitelist", (scope, user_id))
+            state_store.mark("approved_users", (scope, user_id))
+        if is_exempt(message.chat.id, user_id):
+            status_msg = await message.reply(f"⚠️ {user_name} (ID: {user_id}) is whitelisted in all groups; only the bot owner can remove that.")
+        else:
+            status_msg = await message.reply(f"❌ {user_name} (ID: {user_id}) removed from whitelist!")
+        schedule_delete(status_msg, 10)
+
+async def describe_user(user_id: int):
+    # (username, full_name) from the directory, else from getChat (then remembered)
+    known = member_directory.get(user_id)
+    if known is None:
+        user = await bot.get_chat(user_id)
+        member_directory.observe(None, user)
+        known = (user.username, user.full_name)
+    return known
+
+def _match_whitelisted(arg: str, listed: set):
+    if arg.isdigit() and int(arg) in listed:
+        return int(arg)
+    user_id = member_directory.find_username(arg)
+    if user_id in listed:
+        return user_id
+    return member_directory.find_name(arg, within=listed)
+
+async def find_whitelisted(arg: str, chat_id: int):
+    listed = whitelist.visible(chat_id)
+    user_id = _match_whitelisted(arg, listed)
+    if user_id is None:
+        # Whitelisted users the directory hasn't seen (e.g. since a restart)
+        # are looked up once; after that they resolve locally
+        for uid in [uid for uid in listed if member_directory.get(uid) is None]:
+            try:
+                await describe_user(uid)
+            except Exception:
+                continue
+        user_id = _match_whitelisted(arg, listed)
+    return user_id
 
 @dp.message(Command("whitelistshow"))
 async def whitelist_show(message: types.Message):
     if not await is_admin(message.chat.id, message.from_user.id):
         status_msg = await message.reply("❌ Only admins can use this command!")
-        asyncio.create_task(auto_delete(status_msg, 10))
+        schedule_delete(status_msg, 10)
         return
     
-    if not whitelist: 
+    listed = whitelist.visible(message.chat.id)
+    if not listed: 
         status_msg = await message.reply("No whitelisted users.")
-        asyncio.create_task(auto_delete(status_msg, 10))
+        schedule_delete(status_msg, 10)
         return
         
     whitelist_info = "👤 *Whitelisted Users:*\n"
-    for user_id in list(whitelist):
+    for user_id in sorted(listed):
         try:
-            user = await bot.get_chat(user_id)
-            username = f"@{user.username}" if user.username else "No username"
-            whitelist_info += f"• {user.full_name} ({username}) - ID: `{user_id}`\n"
+            username, full_name = await describe_user(user_id)
+            username = f"@{username}" if username else "No username"
+            whitelist_info += f"• {full_name} ({username}) - ID: `{user_id}`\n"
         except:
             whitelist_info += f"• Unknown User (ID: `{user_id}`)\n"
     
     status_msg = await message.reply(whitelist_info, parse_mode="Markdown")
-    asyncio.create_task(auto_delete(status_msg, 15))
+    schedule_delete(status_msg, 15)
 
 # --- Owner Commands ---
 @dp.message(Command("botstats"))
@@ -659,7 +2772,12 @@ async def bot_stats(message: types.Message):
         f"📊 Total Groups: {len(group_settings)}\n"
         f"👤 Whitelisted Users: {len(whitelist)}\n"
         f"✅ Approved Users: {len(approved_users)}\n"
-        f"⚠️ Total Warnings: {sum(warnings.values())}\n"
+        f"⚠️ Active Warnings: {warning_store.total():.1f} across {len(warning_store)} users "
+        f"({warning_store.issued} issued since start)\n"
+        f"🧠 Bio Cache: {len(user_bio_cache)} users, {user_bio_cache.hits} hits / "
+        f"{user_bio_cache.misses} misses / {user_bio_cache.coalesced} coalesced\n"
+        f"🛡️ Admin Rosters: {len(admin_roster)} chats, {admin_roster.loads} loads\n"
+        f"🗑️ Pending Deletions: {len(deletion_scheduler)}\n"
         f"🕒 Start Time: {time.strftime('%Y-%m-%d %H:%M:%S')}"
     )
     
@@ -696,11 +2814,12 @@ async def whitelist_info(message: types.Message):
         return
     
     whitelist_info = []
-    for user_id in list(whitelist)[:20]:
+    for chat_id, user_id in itertools.islice(whitelist.entries(), 20):
+        scope = "all groups" if chat_id == GLOBAL_SCOPE else f"group {chat_id}"
         try:
-            user = await bot.get_chat(user_id)
-            username = f"@{user.username}" if user.username else "No username"
-            user_info = f"• {user.full_name} ({username}) - ID: {user_id}"
+            username, full_name = await describe_user(user_id)
+            username = f"@{username}" if username else "No username"
+            user_info = f"• {full_name} ({username}) - ID: {user_id}, {scope}"
             whitelist_info.append(user_info)
         except:
             whitelist_info.append(f"• Unknown User (ID: {user_id}")
@@ -734,6 +2853,7 @@ async def group_info_owner(message: types.Message):
             f"• Bio Links: {'✅ ON' if settings.get('biolinks', True) else '❌ OFF'}\n"
             f"• Usernames: {'✅ ON' if settings.get('username', True) else '❌ OFF'}\n"
             f"• Bot Links: {'✅ ON' if settings.get('botlink', True) else '❌ OFF'}\n"
+            f"• Spam Waves: {'✅ ON' if settings.get('spamwave', True) else '❌ OFF'}\n"
         )
         
         await message.reply(info_text)
@@ -741,6 +2861,113 @@ async def group_info_owner(message: types.Message):
     except Exception as e:
         await message.reply(f"❌ Error: {str(e)}")
 
+# --- Broadcast Engine ---
+# Copies run on a bounded pool of workers, paced by their own token bucket on
+# top of the outbound scheduler's global and per-chat limits (which also handle
+# flood waits). Progress is checkpointed to the state store on
+# every progress tick, so a restart resumes with the chats not yet reached
+# (chats sent to since the last flushed checkpoint may receive it twice).
+broadcast_bucket = TokenBucket(BROADCAST_RATE)
+broadcast_task = None
+
+def save_broadcast_state(state: dict):
+    state_store.put_kv("broadcast", dict(state))
+
+def load_broadcast_state():
+    return state_store.get_kv("broadcast")
+
+def clear_broadcast_state():
+    state_store.put_kv("broadcast", None)
+
+async def send_broadcast_copy(chat_id: int, state: dict) -> bool:
+    await broadcast_bucket.acquire()
+    try:
+        await bot.copy_message(
+            chat_id=chat_id,
+            from_chat_id=state["from_chat_id"],
+            message_id=state["message_id"]
+        )
+        return True
+    except Exception as e:
+        logger.warning("Broadcast failed", extra={"chat_id": chat_id, "error": str(e)})
+        return False
+
+async def update_broadcast_status(state: dict, text: str):
+    try:
+        await bot.edit_message_text(text, chat_id=state["status_chat_id"], message_id=state["status_message_id"])
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e).lower():
+            logger.warning("Broadcast status update failed", extra={"error": str(e)})
+    except Exception as e:
+        logger.warning("Broadcast status update failed", extra={"error": str(e)})
+
+async def run_broadcast(state: dict):
+    queue = asyncio.Queue()
+    for chat_id in state["pending"]:
+        queue.put_nowait(chat_id)
+    done = set()
+    total = state["success"] + state["failed"] + len(state["pending"])
+
+    async def worker():
+        while True:
+            try:
+                chat_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if await send_broadcast_copy(chat_id, state):
+                state["success"] += 1
+            else:
+                state["failed"] += 1
+            done.add(chat_id)
+
+    def checkpoint():
+        state["pending"] = [chat_id for chat_id in state["pending"] if chat_id not in done]
+        done.clear()
+        save_broadcast_state(state)
+
+    workers = [asyncio.create_task(worker()) for _ in range(BROADCAST_CONCURRENCY)]
+    try:
+        while True:
+            finished, _ = await asyncio.wait(workers, timeout=BROADCAST_PROGRESS_INTERVAL)
+            if len(finished) == len(workers):
+                break
+            checkpoint()
+            await update_broadcast_status(
+                state,
+                f"📤 Broadcasting...\n\n"
+                f"✅ Success: {state['success']}\n"
+                f"❌ Failed: {state['failed']}\n"
+                f"📋 Progress: {state['success'] + state['failed']}/{total}"
+            )
+    except asyncio.CancelledError:
+        for task in workers:
+            task.cancel()
+        checkpoint()
+        raise
+
+    clear_broadcast_state()
+    await update_broadcast_status(
+        state,
+        f"📊 **Broadcast Complete**\n\n"
+        f"✅ Success: {state['success']}\n"
+        f"❌ Failed: {state['failed']}\n"
+        f"📋 Total: {state['success'] + state['failed']}"
+    )
+
+def start_broadcast(state: dict):
+    global broadcast_task
+    broadcast_task = asyncio.create_task(run_broadcast(state))
+    return broadcast_task
+
+@dp.startup()
+async def resume_broadcast():
+    if shard_index is not None and shard_index != shard_of(BOT_OWNER_ID):
+        return  # one worker resumes it
+    state = load_broadcast_state()
+    if state and state["pending"]:
+        logger.info("Resuming broadcast to %d remaining groups", len(state["pending"]))
+        start_broadcast(state)
+
 @dp.message(Command("broadcast"))
 async def broadcast_message(message: types.Message):
     if not is_owner(message.from_user.id):
@@ -777,31 +3004,24 @@ async def confirm_broadcast(callback: types.CallbackQuery):
     if not pending_broadcast:
         await callback.answer("No pending broadcast.")
         return
+
+    if broadcast_task is not None and not broadcast_task.done():
+        await callback.answer("A broadcast is already running.")
+        return
     
     await callback.message.edit_text("📤 Broadcasting started...")
-    
-    success = 0
-    failed = 0
-    
-    for chat_id in group_settings.keys():
-        try:
-            await bot.copy_message(
-                chat_id=chat_id,
-                from_chat_id=pending_broadcast.chat.id,
-                message_id=pending_broadcast.message_id
-            )
-            success += 1
-            await asyncio.sleep(0.5)  # Rate limiting
-        except Exception as e:
-            print(f"Broadcast failed to {chat_id}: {e}")
-            failed += 1
-    
-    await callback.message.edit_text(
-        f"📊 **Broadcast Complete**\n\n"
-        f"✅ Success: {success}\n"
-        f"❌ Failed: {failed}\n"
-        f"📋 Total: {success + failed}"
-    )
+
+    state = {
+        "from_chat_id": pending_broadcast.chat.id,
+        "message_id": pending_broadcast.message_id,
+        "pending": list(group_settings.keys()),
+        "success": 0,
+        "failed": 0,
+        "status_chat_id": callback.message.chat.id,
+        "status_message_id": callback.message.message_id,
+    }
+    save_broadcast_state(state)
+    start_broadcast(state)
     
     pending_broadcast = None
 
@@ -819,8 +3039,12 @@ async def restart_bot(message: types.Message):
     if not is_owner(message.from_user.id):
         return
     
-    await message.reply("🔄 Restarting bot...")
-    os.execl(sys.executable, sys.executable, *sys.argv)
+    global restart_notice
+    reply = await message.reply("🔄 Restarting bot...")
+    restart_notice = (reply.chat.id, reply.message_id)
+    # Intake stops, queued work drains and the process re-executes itself;
+    # the front process restarts all shard workers
+    os.kill(os.getpid() if shard_index is None else os.getppid(), signal.SIGHUP)
 
 @dp.message(Command("maintenance"))
 async def maintenance_mode(message: types.Message):
@@ -834,6 +3058,7 @@ async def maintenance_mode(message: types.Message):
     
     global maintenance_active
     maintenance_active = args[1].lower() == "on"
+    state_store.put_kv("maintenance", maintenance_active)
     
     status = "🟢 ACTIVATED" if maintenance_active else "🔴 DEACTIVATED"
     await message.reply(f"🔧 Maintenance mode: {status}")
@@ -932,7 +3157,7 @@ async def help_callback(callback: types.CallbackQuery):
         await callback.answer("Help menu opened!")
         
     except Exception as e:
-        print(f"Error in help callback: {e}")
+        logger.exception("Error in help callback")
         await callback.answer("❌ Error!")
 
 # --- FIXED BACK TO MAIN WITH PHOTO SUPPORT ---
@@ -988,7 +3213,7 @@ async def back_to_main(callback: types.CallbackQuery):
         await callback.answer("Back to main menu!")
             
     except Exception as e:
-        print(f"Error in back_to_main: {e}")
+        logger.exception("Error in back_to_main")
         await callback.answer("❌ Error!")
 
 # --- FIXED CLOSE HELP ---  
@@ -1016,13 +3241,247 @@ async def unmute_user(callback: types.CallbackQuery):
         )
         
         await callback.message.edit_text(f"✅ User unmuted successfully!")
-        await asyncio.sleep(3)
-        await callback.message.delete()
+        schedule_delete(callback.message, 3)
         
     except Exception as e:
         await callback.answer(f"❌ Unmute failed: {e}")
 
+# --- Member Directory Updates ---
+@dp.message.outer_middleware()
+async def member_directory_middleware(handler, message: types.Message, data: dict):
+    if message.from_user is not None and message.chat.type in ["group", "supergroup"]:
+        member_directory.observe(message.chat.id, message.from_user)
+        reply = message.reply_to_message
+        if reply is not None and reply.from_user is not None:
+            member_directory.observe(message.chat.id, reply.from_user)
+        for user in message.new_chat_members or ():
+            member_directory.observe(message.chat.id, user)
+    return await handler(message, data)
+
+# --- Backlog Catch-up ---
+# After downtime Telegram hands over everything it buffered. Group messages
+# older than CATCHUP_AGE skip the per-message path, whose warnings would be
+# stale by now: they are collected per chat and classified in batches, and
+# violations go to the deletion scheduler (bulk deleteMessages) without
+# warnings, strikes or log events. Bio links are judged from the cache only.
+# Once a chat has had no backlog for CATCHUP_QUIET seconds, one summary is
+# posted there. Stale commands are dropped. Fresh messages are handled
+# normally throughout.
+class CatchUp:
+    def __init__(self, max_age: float, quiet: float):
+        self.max_age = max_age
+        self.quiet = quiet
+        self._batches = {}  # chat_id: [message]
+        self._summaries = {}  # chat_id: {"checked": n, violation_type: n}
+        self._drains = {}  # chat_id: Task
+        self.tasks = set()
+
+    def is_stale(self, message: types.Message) -> bool:
+        return time.time() - message.date.timestamp() > self.max_age
+
+    def add(self, message: types.Message):
+        chat_id = message.chat.id
+        self._batches.setdefault(chat_id, []).append(message)
+        if chat_id not in self._drains:
+            task = self._drains[chat_id] = asyncio.create_task(self._drain(chat_id))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _drain(self, chat_id: int):
+        # Classify whatever arrived during each quiet period; stop after one
+        # without new backlog
+        try:
+            while True:
+                await asyncio.sleep(self.quiet)
+                batch = self._batches.pop(chat_id, None)
+                if not batch:
+                    break
+                try:
+                    await self._classify(chat_id, batch)
+                except asyncio.CancelledError:
+                    # Shutdown: what is left goes back for the snapshot
+                    self._batches[chat_id] = batch + self._batches.get(chat_id, [])
+                    raise
+        finally:
+            del self._drains[chat_id]
+        await self._post_summary(chat_id)
+
+    async def _classify(self, chat_id: int, batch: list):
+        # If cancelled, batch is cut down to the messages not yet classified
+        settings = get_group_settings(chat_id)
+        summary = self._summaries.setdefault(chat_id, {"checked": 0})
+        index = 0
+        try:
+            for index, message in enumerate(batch):
+                summary["checked"] += 1
+                MESSAGES_CHECKED.inc()
+                CATCHUP_MESSAGES.inc("checked")
+                user = message.from_user
+                if is_exempt(chat_id, user.id) or await is_admin(chat_id, user.id):
+                    continue
+                violation_type = classify_content(message, settings)
+                if violation_type is None and settings["biolinks"] and user_bio_cache.peek(user.id, profile_key(user)):
+                    violation_type = "biolinks"
+                if violation_type is None:
+                    continue
+                deletion_scheduler.schedule(chat_id, message.message_id, 0)
+                summary[violation_type] = summary.get(violation_type, 0) + 1
+                VIOLATIONS.inc(violation_type, "catchup_deleted")
+                CATCHUP_MESSAGES.inc("deleted")
+        except asyncio.CancelledError:
+            del batch[:index]
+            raise
+
+    def pending_updates(self) -> list:
+        # Batched messages not yet classified, as updates for the snapshot
+        return [{"update_id": 0, "message": message.model_dump(mode="json", by_alias=True, exclude_none=True)}
+                for batch in self._batches.values() for message in batch]
+
+    async def _post_summary(self, chat_id: int):
+        summary = self._summaries.pop(chat_id, None)
+        if summary is None:
+            return
+        checked = summary.pop("checked")
+        deleted = sum(summary.values())
+        logger.info("Backlog caught up: %d of %d messages deleted", deleted, checked, extra={"chat_id": chat_id})
+        if not deleted:
+            return
+        details = ", ".join(f"{count} {violation_type}" for violation_type, count in sorted(summary.items()))
+        try:
+            await bot.send_message(
+                chat_id,
+                f"🧹 Caught up after a restart: removed {deleted} of {checked} missed messages ({details})."
+            )
+        except Exception as e:
+            logger.warning("Catch-up summary failed", extra={"chat_id": chat_id, "error": str(e)})
+
+catch_up = CatchUp(CATCHUP_AGE, CATCHUP_QUIET)
+
+@dp.message.outer_middleware()
+async def catchup_middleware(handler, message: types.Message, data: dict):
+    if not CATCHUP or not catch_up.is_stale(message):
+        return await handler(message, data)
+    if message.text and message.text.startswith("/"):
+        CATCHUP_MESSAGES.inc("command_dropped")
+        return None
+    if (message.text or message.caption) and message.from_user is not None and \
+            message.chat.type in ["group", "supergroup"] and not maintenance_active:
+        catch_up.add(message)
+        return None
+    return await handler(message, data)
+
+# --- Admin Roster Updates ---
+@dp.my_chat_member()
+async def on_my_chat_member(update: types.ChatMemberUpdated):
+    # The bot's own status changed: drop the roster so it is reloaded (or
+    # forgotten, if the bot was removed)
+    admin_roster.forget(update.chat.id)
+
+@dp.chat_member()
+async def on_chat_member(update: types.ChatMemberUpdated):
+    member = update.new_chat_member
+    admin_roster.update_member(update.chat.id, member.user.id, member.status)
+    user_bio_cache.note_profile(member.user)
+    if member.status in JOIN_STATUSES + ADMIN_STATUSES:
+        member_directory.observe(update.chat.id, member.user)
+    else:
+        member_directory.leave(update.chat.id, member.user.id)
+    if member.status in JOIN_STATUSES and update.old_chat_member.status not in JOIN_STATUSES + ADMIN_STATUSES:
+        on_member_joined(update.chat, member.user)
+
+@dp.message(F.new_chat_members)
+async def on_new_chat_members(message: types.Message):
+    if message.chat.type in ["group", "supergroup"]:
+        for user in message.new_chat_members:
+            on_member_joined(message.chat, user)
+
+# --- Join Prefetch ---
+# A joining member's bio and the chat's admin roster are looked up in the
+# background, so their first message is decided from cache. Both join events
+# (chat_member and the new_chat_members service message) may arrive; the
+# second is ignored. With JOIN_BIO_ACTION=mute, joiners whose bio already
+# breaks the rules are muted straight away.
+JOIN_STATUSES = (ChatMemberStatus.MEMBER, ChatMemberStatus.RESTRICTED)
+
+join_tasks = set()
+recent_joins = TTLCache(10000, 60)  # (chat_id, user_id) already prefetched
+
+def on_member_joined(chat: types.Chat, user: types.User):
+    if not JOIN_PREFETCH or user.is_bot or recent_joins.get((chat.id, user.id)):
+        return
+    recent_joins.set((chat.id, user.id), True)
+    user_bio_cache.note_profile(user)
+    if len(join_tasks) >= JOIN_PREFETCH_MAX_TASKS or update_pipeline.shedding("join_prefetch"):
+        JOINS.inc("skipped")  # the first message will do the lookup
+        return
+    task = asyncio.create_task(prefetch_member(chat, user))
+    join_tasks.add(task)
+    task.add_done_callback(join_tasks.discard)
+
+async def prefetch_member(chat: types.Chat, user: types.User):
+    # Both lookups handle their own errors and cache the outcome
+    user_is_admin, has_bio_links = await asyncio.gather(
+        is_admin(chat.id, user.id),
+        check_user_bio(user.id, profile_key(user))
+    )
+    JOINS.inc("prefetched")
+    if not has_bio_links or JOIN_BIO_ACTION != "mute" or user_is_admin:
+        return
+    if is_exempt(chat.id, user.id) or not get_group_settings(chat.id)["biolinks"]:
+        return
+    try:
+        await bot.restrict_chat_member(
+            chat.id,
+            user.id,
+            permissions=types.ChatPermissions(can_send_messages=False),
+            until_date=int(time.time()) + mute_duration * 60
+        )
+    except TelegramBadRequest as e:
+        logger.warning("Join mute failed", extra={"chat_id": chat.id, "user_id": user.id, "error": str(e)})
+        return
+    JOINS.inc("bio_muted")
+    log_sink.log(chat.id, chat.title, "join_mute", user)
+
 # --- UPDATED: Message Filtering with Specific Violation Types ---
+def classify_content(message: types.Message, settings: dict) -> Optional[str]:
+    """First violation in the message's own content enabled for the group, or None."""
+    # Single pass over the text, then report in priority order
+    with STAGE_SECONDS.time("scan"):
+        found = scan_message(message)
+
+    # Group domain lists: a blocked host is a violation even with /links off,
+    # links whose hosts are all allowed are not
+    blocked = False
+    if domain_lists.covers(message.chat.id):
+        with STAGE_SECONDS.time("domains"):
+            hosts = message_link_hosts(message, found.get("links", ()))
+            verdicts = [domain_lists.verdict(message.chat.id, host) for host in hosts]
+        if False in verdicts:
+            blocked = True
+            found.setdefault("links", [])
+        elif verdicts and all(verdicts):
+            found.pop("links", None)
+
+    for violation_type in VIOLATION_ORDER:
+        if (settings[violation_type] or blocked and violation_type == "links") and violation_type in found:
+            return violation_type
+    return None
+
+async def purge_wave(wave: SpamWave, message: types.Message):
+    # First copy past the threshold: remove the copies seen before it
+    refs, wave.refs = wave.refs, []
+    SPAM_WAVES.inc()
+    logger.info("Spam wave detected in %d groups from %d senders", len(wave.chats), len(wave.senders),
+                extra=message_fields(message))
+    log_sink.log(message.chat.id, message.chat.title, "spamwave", message.from_user)
+    for chat_id, message_id, user_id in refs:
+        if message_id == message.message_id and chat_id == message.chat.id:
+            continue
+        if is_exempt(chat_id, user_id) or await is_admin(chat_id, user_id):
+            continue
+        deletion_scheduler.schedule(chat_id, message_id, 0)
+        VIOLATIONS.inc("spamwave", "purged")
+
 @dp.message(F.text | F.caption)
 async def filter_messages(message: types.Message):
     if maintenance_active and not is_owner(message.from_user.id):
@@ -1031,51 +3490,58 @@ async def filter_messages(message: types.Message):
     if message.chat.type not in ["group", "supergroup"]:
         return
     
-    # Skip if user is whitelisted or approved
-    if message.from_user.id in whitelist or message.from_user.id in approved_users:
+    # Skip if user is whitelisted or approved in this group
+    if is_exempt(message.chat.id, message.from_user.id):
         return
     
     settings = get_group_settings(message.chat.id)
     text = message.text or message.caption or ""
     
-    # Debug logging with user info
-    print(f"Checking message from {message.from_user.id} ({message.from_user.username}): {text[:50]}...")
+    log_sampled("Checking message", message)
     
-    # Check for links first
-    if settings["links"] and has_links(text):
-        print(f"Detected links in message from {message.from_user.id}")
-        await warn_and_delete(message, "links")
-        return
-    
-    # Check for bot usernames
-    if settings["botlink"] and has_bot_username(text):
-        print(f"Detected bot username in message from {message.from_user.id}")
-        await warn_and_delete(message, "botlink")
-        return
-    
-    # Check for regular usernames
-    if settings["username"] and has_username(text):
-        print(f"Detected username in message from {message.from_user.id}")
-        await warn_and_delete(message, "username")
+    MESSAGES_CHECKED.inc()
+
+    # Copies of a cross-chat wave, and anything from its senders, go first
+    if WAVE_DETECTION and settings["spamwave"] and not update_pipeline.shedding("fingerprint"):
+        with STAGE_SECONDS.time("fingerprint"):
+            wave = spam_waves.observe(message.chat.id, message.message_id, message.from_user.id, text) if text else None
+        if (wave or spam_waves.is_flagged(message.from_user.id)) and \
+                not await is_admin(message.chat.id, message.from_user.id):
+            if wave and wave.refs:
+                await purge_wave(wave, message)
+            await warn_and_delete(message, "spamwave", quiet=True)
+            return
+
+    violation_type = classify_content(message, settings)
+    if violation_type is not None:
+        logger.info("Violation detected", extra=message_fields(message, violation=violation_type))
+        await warn_and_delete(message, violation_type)
         return
     
     # Check bio links (only if other checks passed)
-    if settings["biolinks"]:
-        print(f"Checking bio for user {message.from_user.id}...")
-        has_bio_links = await check_user_bio(message.from_user.id)
+    if settings["biolinks"] and not update_pipeline.shedding("bio_check"):
+        with STAGE_SECONDS.time("bio_check"):
+            has_bio_links = await check_user_bio(message.from_user.id, profile_key(message.from_user))
         if has_bio_links:
-            print(f"Detected bio links for user {message.from_user.id}")
+            logger.info("Violation detected", extra=message_fields(message, violation="biolinks"))
             await warn_and_delete(message, "biolinks")
             return
     
-    print(f"Message from {message.from_user.id} passed all checks")
+    log_sampled("Message passed all checks", message)
 
 # --- Error Handler ---
 @dp.errors()
-async def error_handler(update: types.Update, exception: Exception):
-    print(f"Update: {update}")
-    print(f"Exception type: {type(exception).__name__}")
-    print(f"Exception details: {exception}")
+async def error_handler(event: types.ErrorEvent):
+    update, exception = event.update, event.exception
+    allowed, suppressed = error_rate_limiter.allow((type(exception).__name__, update.event_type))
+    if not allowed:
+        return True
+
+    logger.error(
+        "Unhandled %s while handling %s", type(exception).__name__, update.event_type,
+        exc_info=exception,
+        extra={"update_id": update.update_id, "event": update.event_type, "suppressed": suppressed or None}
+    )
     
     # Log to your log chat if it's a critical error
     if "critical" in str(exception).lower() or "forbidden" in str(exception).lower():
@@ -1089,10 +3555,656 @@ async def error_handler(update: types.Update, exception: Exception):
             
     return True
 
+# --- Metrics Endpoint ---
+Gauge("antilink_update_queue_depth", "Updates waiting in the update pipeline", lambda: len(update_pipeline))
+Gauge("antilink_update_queue_chats", "Chats with updates queued or in progress", lambda: update_pipeline.chats())
+Gauge("antilink_update_workers_busy", "Pipeline workers handling an update", lambda: update_pipeline.active)
+Gauge("antilink_outbound_queue_size", "Requests waiting in the outbound scheduler", lambda: len(outbound_scheduler))
+Gauge("antilink_pending_deletions", "Bot messages scheduled for deletion", lambda: len(deletion_scheduler))
+Gauge("antilink_notices_pending", "Warning, mute and admin notices not yet posted", lambda: len(notice_tasks))
+Gauge("antilink_log_events_queued", "Moderation events waiting for the next digest", lambda: len(log_sink))
+Gauge("antilink_bio_cache_size", "Users in the bio cache", lambda: len(user_bio_cache))
+Gauge("antilink_admin_rosters", "Chats with a cached admin roster", lambda: len(admin_roster))
+Gauge("antilink_member_directory_size", "Users in the member directory", lambda: len(member_directory))
+Gauge("antilink_spam_waves_tracked", "Distinct texts tracked for spam waves", lambda: len(spam_waves))
+Gauge("antilink_spam_wave_senders_flagged", "Senders flagged by a spam wave", lambda: len(spam_waves.flagged))
+Gauge("antilink_raids_active", "Groups in raid mode", lambda: len(raid_guard.raids))
+Gauge("antilink_listed_domains", "Domains on group allow/block lists", lambda: len(domain_lists))
+Gauge("antilink_groups", "Known groups", lambda: len(group_settings))
+Gauge("antilink_asyncio_tasks", "Tasks alive on the event loop", lambda: len(asyncio.all_tasks()))
+Gauge("antilink_restart_ready_seconds", "Seconds intake was stopped by the last restart",
+      lambda: restart_ready_seconds)
+Gauge("antilink_bio_cache_hits_total", "Bio cache hits", lambda: user_bio_cache.hits, kind="counter")
+Gauge("antilink_bio_cache_misses_total", "Bio cache misses", lambda: user_bio_cache.misses, kind="counter")
+Gauge("antilink_bio_cache_coalesced_total", "Bio lookups that joined an in-flight request",
+      lambda: user_bio_cache.coalesced, kind="counter")
+Gauge("antilink_outbound_dropped_total", "Stale requests dropped by the outbound scheduler",
+      lambda: outbound_scheduler.dropped, kind="counter")
+Gauge("antilink_outbound_flood_waits_total", "Flood waits (retry_after) received",
+      lambda: outbound_scheduler.flood_waits, kind="counter")
+
+@dp.update.outer_middleware()
+async def update_timing_middleware(handler, event: types.Update, data: dict):
+    with UPDATE_SECONDS.time(event.event_type):
+        return await handler(event, data)
+
+async def handle_metrics(request: web.Request):
+    return web.Response(text=render_metrics(), content_type="text/plain", headers={"Cache-Control": "no-cache"})
+
+async def handle_health(request: web.Request):
+    return web.Response(text="ok")
+
+def add_metrics_routes(app: web.Application):
+    if METRICS_ENABLED:
+        app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/", handle_health)
+
+async def start_metrics_server(port: int = PORT):
+    # Polling mode has no webhook server, so /metrics gets its own
+    app = web.Application()
+    add_metrics_routes(app)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, WEBHOOK_HOST, port).start()
+    except OSError as e:
+        logger.error("Metrics server failed to bind %s:%s", WEBHOOK_HOST, port, extra={"error": str(e)})
+        await runner.cleanup()
+        return None
+    logger.info("Metrics on %s:%s/metrics", WEBHOOK_HOST, port)
+    return runner
+
+# --- Update Pipeline ---
+# Every update, whether polled, posted to the webhook or routed to a shard,
+# goes through one bounded pipeline. Updates wait in per-chat FIFO queues and
+# a fixed pool of UPDATE_WORKERS tasks takes chats in round-robin order. A
+# chat is held by one worker at a time, so its updates are handled in order
+# while other chats proceed in parallel, and at most UPDATE_WORKERS handlers
+# (bio lookups, admin checks, ...) run at once. No more than
+# UPDATE_QUEUE_SIZE updates wait in total: the webhook answers 503 beyond
+# that and polling stops fetching. As the queue fills, optional stages are
+# skipped at the fill levels set in LOAD_SHED.
+UPDATE_CHAT_KEYS = ("message", "edited_message", "channel_post", "edited_channel_post",
+                    "my_chat_member", "chat_member", "chat_join_request")
+
+def update_chat_id(data: dict) -> int:
+    for key in UPDATE_CHAT_KEYS:
+        event = data.get(key)
+        if event is not None:
+            return event["chat"]["id"]
+    callback = data.get("callback_query")
+    if callback is not None and callback.get("message"):
+        return callback["message"]["chat"]["id"]
+    for event in data.values():
+        if isinstance(event, dict) and "from" in event:
+            return event["from"]["id"]
+    return 0
+
+class UpdatePipeline:
+    def __init__(self, workers: int, maxsize: int):
+        self.workers = workers
+        self.maxsize = maxsize
+        self._chats = {}  # chat_id: deque of (data, queued_at); present while queued or in progress
+        self._ready = deque()  # chats with queued updates and no worker on them
+        self._size = 0
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._idle = asyncio.Event()
+        self.active = 0  # updates being handled
+        self.handled = 0
+        self.closed = False  # set on shutdown: webhook deliveries are refused
+
+    def _push(self, data: dict):
+        chat_id = update_chat_id(data)
+        pending = self._chats.get(chat_id)
+        if pending is None:
+            pending = self._chats[chat_id] = deque()
+            self._ready.append(chat_id)
+            self._not_empty.set()
+        pending.append((data, time.monotonic()))
+        self._size += 1
+        self._idle.clear()
+
+    def put_nowait(self, data: dict) -> bool:
+        if self.closed or self._size >= self.maxsize:
+            return False
+        self._push(data)
+        return True
+
+    async def put(self, data: dict):
+        # Polling and shard inboxes: wait for room instead of dropping
+        while self._size >= self.maxsize:
+            self._not_full.clear()
+            await self._not_full.wait()
+        self._push(data)
+
+    async def join(self):
+        while self._size or self.active:
+            await self._idle.wait()
+
+    def close(self):
+        self.closed = True
+
+    def requeue(self, updates: list):
+        # Updates handed over from the previous process, ahead of new intake
+        for data in updates:
+            self._push(data)
+
+    def pending(self) -> list:
+        # Updates not yet handled, in order within each chat
+        return [data for chat in self._chats.values() for data, _ in chat]
+
+    def shedding(self, stage: str) -> bool:
+        level = LOAD_SHED.get(stage)
+        if level is None or self._size < level * self.maxsize:
+            return False
+        SHED.inc(stage)
+        return True
+
+    async def _worker(self):
+        while True:
+            while not self._ready:
+                self._not_empty.clear()
+                await self._not_empty.wait()
+            chat_id = self._ready.popleft()
+            pending = self._chats[chat_id]
+            data, queued_at = pending.popleft()
+            self._size -= 1
+            self._not_full.set()
+            self.active += 1
+            UPDATE_WAIT_SECONDS.observe(time.monotonic() - queued_at)
+            try:
+                update = types.Update.model_validate(data, context={"bot": bot})
+                await dp.feed_update(bot, update)
+            except asyncio.CancelledError:
+                # Cut off by the shutdown deadline: handed to the next process
+                # and handled again from the start
+                pending.appendleft((data, queued_at))
+                self._size += 1
+                raise
+            except Exception:
+                logger.exception("Failed to process update", extra={"update_id": data.get("update_id")})
+            finally:
+                self.active -= 1
+                self.handled += 1
+                if pending:
+                    self._ready.append(chat_id)
+                    self._not_empty.set()
+                else:
+                    del self._chats[chat_id]
+                if not self._size and not self.active:
+                    self._idle.set()
+
+    def start(self) -> list:
+        return [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def chats(self) -> int:
+        return len(self._chats)
+
+    def __len__(self):
+        return self._size
+
+update_pipeline = UpdatePipeline(UPDATE_WORKERS, UPDATE_QUEUE_SIZE)
+
+poll_offset = None  # next getUpdates offset; Telegram treats lower ids as confirmed once it is sent
+
+async def poll_updates(deliver):
+    # getUpdates without building aiogram models; each update is handed to
+    # `deliver` (which may wait for room) before its offset is confirmed
+    global poll_offset
+    url = bot.session.api.api_url(token=bot.token, method="getUpdates")
+    params = {"timeout": 30, "allowed_updates": json.dumps(dp.resolve_used_update_types())}
+    if poll_offset is not None:
+        params["offset"] = poll_offset
+    backoff = 1
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60)) as session:
+        while True:
+            try:
+                async with session.post(url, data=params) as response:
+                    payload = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.warning("getUpdates failed", extra={"error": str(e)})
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            if not payload.get("ok"):
+                retry_after = (payload.get("parameters") or {}).get("retry_after") or backoff
+                logger.warning("getUpdates refused", extra={"error": payload.get("description")})
+                await asyncio.sleep(retry_after)
+                backoff = min(backoff * 2, 30)
+                continue
+            backoff = 1
+            for data in payload["result"]:
+                await deliver(data)
+                params["offset"] = poll_offset = data["update_id"] + 1
+
+async def commit_poll_offset():
+    # The poller only confirms updates with its next request; confirm them now
+    # so the next process does not receive them again
+    if poll_offset is None:
+        return
+    try:
+        await bot.get_updates(offset=poll_offset, limit=1, timeout=0)
+    except Exception as e:
+        logger.warning("Could not confirm the polling offset", extra={"error": str(e)})
+
+# --- Webhook Delivery ---
+# Updates are acknowledged as soon as they are queued. A full pipeline
+# answers 503 so Telegram redelivers later instead of us buffering without
+# bound.
+async def handle_webhook(request: web.Request):
+    # Constant-time; bytes, as compare_digest rejects non-ASCII str
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode("utf-8", "surrogateescape")
+    if not hmac.compare_digest(secret, WEBHOOK_SECRET.encode()):
+        return web.Response(status=401)
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.Response(status=400)
+    if not enqueue_update(data):
+        return web.Response(status=503)
+    return web.Response()
+
+def enqueue_update(data: dict) -> bool:
+    if shard_router is not None:
+        return shard_router.route(data)
+    return update_pipeline.put_nowait(data)
+
+def build_webhook_app():
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle_webhook)
+    add_metrics_routes(app)
+    return app
+
+async def start_webhook():
+    # Bind the server and register the webhook; returns None when that fails
+    # and falling back to polling is allowed
+    runner = web.AppRunner(build_webhook_app())
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, WEBHOOK_HOST, PORT).start()
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+    except Exception as e:
+        await runner.cleanup()
+        if not WEBHOOK_FALLBACK_POLLING:
+            raise
+        logger.error("Webhook setup failed, falling back to polling", extra={"error": str(e)})
+        return None
+    logger.info("Webhook listening on %s:%s%s", WEBHOOK_HOST, PORT, WEBHOOK_PATH)
+    return runner
+
+async def serve_updates(runner: Optional[web.AppRunner], polling: bool, resumed: Optional[dict]):
+    # Single-process bot: feed the pipeline from getUpdates or the webhook
+    # (served by `runner`, which also carries /metrics) until SIGINT/SIGTERM,
+    # or SIGHUP to restart in place. `resumed` is the restored snapshot
+    workers = update_pipeline.start()
+    poller = None
+    stop = asyncio.Event()
+    restart = False
+    def request_stop(restart_after: bool):
+        # SIGINT/SIGTERM during a restart's drain turn it into a plain stop
+        nonlocal restart
+        restart = restart_after
+        stop.set()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, request_stop, False)
+    loop.add_signal_handler(signal.SIGHUP, request_stop, True)
+    try:
+        if polling:
+            # getUpdates is refused while a webhook is set
+            await bot.delete_webhook()
+            poller = asyncio.create_task(poll_updates(update_pipeline.put))
+        await dp.emit_startup(bot=bot, dispatcher=dp)
+        await report_ready(resumed)
+        await stop.wait()
+
+        stopped_at = time.time()
+        update_pipeline.close()
+        if poller is not None:
+            poller.cancel()
+        await drain_work(workers, SHUTDOWN_DRAIN_TIMEOUT)
+        write_snapshot(stopped_at)
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await commit_poll_offset()
+    finally:
+        if poller is not None:
+            poller.cancel()
+        for worker in workers:
+            worker.cancel()
+        if runner is not None:
+            await runner.cleanup()
+        await bot.session.close()
+    if restart:
+        stop_logging()
+        os.execl(sys.executable, sys.executable, *sys.argv)
+
+# --- Sharding ---
+# With SHARD_WORKERS set, the main process only receives updates (getUpdates
+# or webhook) and routes each one by chat_id to a worker process running the
+# usual handlers. A chat always lands on the same worker, so its updates stay
+# in order and its state lives on one event loop. Workers share the SQLite
+# store; whitelist, approvals and maintenance mode changed on one worker reach
+# the others after the next flush. Each worker gets an equal share of
+# OUTBOUND_RATE and serves /metrics on PORT + 1 + its index.
+def shard_of(chat_id: int) -> int:
+    return chat_id % SHARD_WORKERS
+
+class ShardRouter:
+    def __init__(self, count: int):
+        context = multiprocessing.get_context("spawn")
+        self.inboxes = [context.Queue(SHARD_QUEUE_SIZE) for _ in range(count)]
+        self.processes = [
+            context.Process(target=run_shard_worker, args=(index, inbox), name=f"shard-{index}", daemon=True)
+            for index, inbox in enumerate(self.inboxes)
+        ]
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def route(self, data: dict) -> bool:
+        try:
+            self.inboxes[shard_of(update_chat_id(data))].put_nowait(data)
+        except queue.Full:
+            return False
+        return True
+
+    async def route_wait(self, data: dict):
+        # Polling: wait for room instead of dropping the update
+        if not self.route(data):
+            await asyncio.to_thread(self.inboxes[shard_of(update_chat_id(data))].put, data)
+
+    async def stop(self, timeout: float = 30):
+        # Workers finish what is queued, flush their state and exit
+        for inbox in self.inboxes:
+            await asyncio.to_thread(inbox.put, None)
+        for process in self.processes:
+            await asyncio.to_thread(process.join, timeout)
+            if process.is_alive():
+                logger.warning("Shard worker did not stop in time", extra={"event": process.name})
+                process.terminate()
+
+def _read_inbox(inbox, loop):
+    # Worker thread: move updates from the process queue to the update
+    # pipeline in batches, waiting while it is full; returns on the stop sentinel
+    while True:
+        batch = [inbox.get()]
+        while batch[-1] is not None and len(batch) < 100:
+            try:
+                batch.append(inbox.get_nowait())
+            except queue.Empty:
+                break
+        asyncio.run_coroutine_threadsafe(_enqueue_batch(batch), loop).result()
+        if batch[-1] is None:
+            return
+
+async def _enqueue_batch(batch: list):
+    for data in batch:
+        if data is not None:
+            await update_pipeline.put(data)
+
+async def serve_shard(inbox):
+    outbound_scheduler.global_bucket = TokenBucket(OUTBOUND_RATE / SHARD_WORKERS)
+    state_store.open()
+    state_store.load()
+    metrics_runner = await start_metrics_server(PORT + 1 + shard_index) if METRICS_ENABLED else None
+    resumed = restore_snapshot()
+    workers = update_pipeline.start()
+    try:
+        await dp.emit_startup(bot=bot, dispatcher=dp)
+        await report_ready(resumed)
+        await asyncio.to_thread(_read_inbox, inbox, asyncio.get_running_loop())
+        stopped_at = time.time()
+        await drain_work(workers, SHUTDOWN_DRAIN_TIMEOUT)
+        write_snapshot(stopped_at)
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+    finally:
+        for worker in workers:
+            worker.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await bot.session.close()
+
+def run_shard_worker(index: int, inbox):
+    global shard_index
+    shard_index = index
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the front process decides when to stop
+    setup_logging()
+    try:
+        asyncio.run(serve_shard(inbox))
+    finally:
+        stop_logging()
+
+shard_router = None
+
+async def serve_sharded():
+    global shard_router
+    shard_router = ShardRouter(SHARD_WORKERS)
+    shard_router.start()
+    logger.info("Routing updates to %d shard workers", SHARD_WORKERS)
+
+    stop = asyncio.Event()
+    restart = False
+    def request_stop(restart_after: bool):
+        # SIGINT/SIGTERM during a restart's drain turn it into a plain stop
+        nonlocal restart
+        restart = restart_after
+        stop.set()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, request_stop, False)
+    loop.add_signal_handler(signal.SIGHUP, request_stop, True)
+
+    runner = poller = None
+    if DELIVERY_MODE == "webhook" and WEBHOOK_URL:
+        runner = await start_webhook()
+    elif DELIVERY_MODE == "webhook":
+        logger.warning("WEBHOOK_URL is not set, falling back to polling")
+    if runner is None:
+        await bot.delete_webhook()
+        poller = asyncio.create_task(poll_updates(shard_router.route_wait))
+    try:
+        await stop.wait()
+        if poller is not None:
+            poller.cancel()
+        await commit_poll_offset()
+    finally:
+        if poller is not None:
+            poller.cancel()
+        if runner is not None:
+            await runner.cleanup()
+        await shard_router.stop(SHUTDOWN_DRAIN_TIMEOUT + 10)
+        await bot.session.close()
+    if restart:
+        stop_logging()
+        os.execl(sys.executable, sys.executable, *sys.argv)
+
+# --- Restart Handoff ---
+# On SIGINT/SIGTERM and /restart (SIGHUP) intake stops first: the poller is
+# cancelled and webhook deliveries get 503, which Telegram retries against
+# the next process. Queued updates and backlog batches then have
+# SHUTDOWN_DRAIN_TIMEOUT to finish. Updates still queued after that, the
+# confirmed polling offset and the caches that are slow to rebuild (bio
+# verdicts, admin rosters, the member directory, spam wave flags) are pickled
+# to SNAPSHOT_PATH, which the next process loads before taking new updates.
+# Scheduled deletions, warnings and broadcast progress are in the state store.
+restart_notice = None  # (chat_id, message_id) of the /restart reply, edited once back
+restart_ready_seconds = 0.0  # intake downtime of the last restart
+
+def snapshot_path() -> str:
+    # One per shard worker; a chat's updates always land on the same worker
+    return SNAPSHOT_PATH if shard_index is None else f"{SNAPSHOT_PATH}.{shard_index}"
+
+async def drain_work(workers: list, timeout: float):
+    # Finish queued updates and backlog batches until the deadline, then stop
+    # the pipeline workers; updates they were still handling are requeued
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    try:
+        await asyncio.wait_for(update_pipeline.join(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    if len(update_pipeline) or update_pipeline.active:
+        logger.warning("Shutdown deadline reached with %d updates queued and %d in progress",
+                       len(update_pipeline), update_pipeline.active)
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    await raid_guard.flush()
+    if catch_up.tasks or notice_tasks:
+        await asyncio.wait({*catch_up.tasks, *notice_tasks}, timeout=max(0, deadline - loop.time()))
+    # Backlog batches still unclassified are handed over with the queued updates
+    drains = list(catch_up.tasks)
+    for task in drains:
+        task.cancel()
+    await asyncio.gather(*drains, return_exceptions=True)
+
+def write_snapshot(stopped_at: float):
+    if not SNAPSHOT_PATH:
+        return
+    start = time.perf_counter()
+    # A chat's backlog is older than its queued updates
+    updates = catch_up.pending_updates() + update_pipeline.pending()
+    state = {
+        "stopped_at": stopped_at,
+        "written_at": time.time(),
+        "updates": updates,
+        "poll_offset": poll_offset,
+        "restart_notice": restart_notice,
+        "bio_cache": user_bio_cache.snapshot(),
+        "admin_rosters": admin_roster.snapshot(),
+        "members": member_directory.snapshot(),
+        "wave_flags": spam_waves.flagged.snapshot(),
+    }
+    path = snapshot_path()
+    try:
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        logger.error("State snapshot failed", extra={"error": str(e)})
+        return
+    logger.info("State snapshot written in %.3fs: %d queued updates, %d bytes",
+                time.perf_counter() - start, len(updates), os.path.getsize(path))
+
+def restore_snapshot() -> Optional[dict]:
+    # Load and remove the previous process's snapshot; call before intake starts
+    global poll_offset, restart_notice
+    if not SNAPSHOT_PATH:
+        return None
+    path = snapshot_path()
+    start = time.perf_counter()
+    try:
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error("Ignoring unreadable state snapshot", extra={"error": str(e)})
+        state = None
+    os.remove(path)
+    if state is None:
+        return None
+
+    elapsed = max(0.0, time.time() - state["written_at"])
+    user_bio_cache.restore(state["bio_cache"], elapsed)
+    admin_roster.restore(state["admin_rosters"], elapsed)
+    member_directory.restore(state["members"])
+    spam_waves.flagged.restore(state["wave_flags"], elapsed)
+    update_pipeline.requeue(state["updates"])
+    if state["poll_offset"] is not None:
+        poll_offset = state["poll_offset"]
+    restart_notice = state["restart_notice"]
+    logger.info("State snapshot restored in %.3fs: %d queued updates", time.perf_counter() - start,
+                len(state["updates"]))
+    return state
+
+async def report_ready(state: Optional[dict]):
+    # Intake is running again: record how long it was stopped
+    global restart_ready_seconds, restart_notice
+    if state is None:
+        return
+    restart_ready_seconds = time.time() - state["stopped_at"]
+    logger.info("Ready %.3fs after intake stopped (%.3fs after the snapshot was written)",
+                restart_ready_seconds, time.time() - state["written_at"])
+    if restart_notice is None:
+        return
+    chat_id, message_id = restart_notice
+    restart_notice = None
+    try:
+        await bot.edit_message_text(
+            f"✅ Restarted: back in {restart_ready_seconds:.1f}s, "
+            f"{len(state['updates'])} queued updates carried over.",
+            chat_id=chat_id, message_id=message_id
+        )
+    except Exception as e:
+        logger.warning("Restart notice update failed", extra={"error": str(e)})
+
+# --- Lifecycle ---
+state_flush_task = None
+
+async def flush_pending_work():
+    # Checkpoint a running broadcast, send queued logs, then write everything
+    # still dirty
+    if broadcast_task is not None and not broadcast_task.done():
+        broadcast_task.cancel()
+        try:
+            await broadcast_task
+        except asyncio.CancelledError:
+            pass
+    await log_sink.flush()
+    await state_store.flush()
+
+deletion_task = None
+log_sink_task = None
+
+@dp.startup()
+async def start_background_tasks():
+    global state_flush_task, deletion_task, log_sink_task
+    state_flush_task = asyncio.create_task(state_store.run())
+    deletion_task = asyncio.create_task(deletion_scheduler.run())
+    log_sink_task = asyncio.create_task(log_sink.run())
+
+@dp.shutdown()
+async def stop_background_tasks():
+    for task in (state_flush_task, deletion_task, log_sink_task, *join_tasks, *raid_guard.tasks, *catch_up.tasks, *notice_tasks):
+        if task is not None:
+            task.cancel()
+    if state_flush_task is not None:
+        # A cancelled flush finishes its write before the last one starts
+        await asyncio.gather(state_flush_task, return_exceptions=True)
+    await flush_pending_work()
+    state_store.close()
+
 # --- Main Function ---
 async def main():
-    print("🤖 Bot is starting...")
-    await dp.start_polling(bot)
+    setup_logging()
+    logger.info("Bot is starting")
+    if SHARD_WORKERS > 0:
+        await serve_sharded()
+        return
+    state_store.open()
+    state_store.load()
+    # Carried-over updates are queued before the webhook can deliver new ones
+    resumed = restore_snapshot()
+    if DELIVERY_MODE == "webhook":
+        if not WEBHOOK_URL:
+            logger.warning("WEBHOOK_URL is not set, falling back to polling")
+        else:
+            runner = await start_webhook()
+            if runner is not None:
+                await serve_updates(runner, polling=False, resumed=resumed)
+                return
+
+    await serve_updates(await start_metrics_server(), polling=True, resumed=resumed)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    finally:
+        stop_logging()